@@ -1,20 +1,259 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from numpy import (arange, argpartition, argsort, asarray, ceil, cumsum, empty, errstate, full, hstack, inf, isnan,
+                   nan, partition, put_along_axis, sqrt, take_along_axis, uint8, vstack, where, zeros)
+from numpy.lib.stride_tricks import sliding_window_view
+from numpy.linalg import LinAlgError, cholesky, eigh
+from numpy.random import SeedSequence, default_rng
+from pandas import DataFrame, Series
+
+from QuantFin.HandleError import InputError
+from QuantFin.tool import EWMAVariance
+
+
+def _check(alpha, window, min_periods):
+    if not 0 < alpha < 1:
+        raise InputError('alpha should be a confidence level between 0 and 1, e.g., 0.99.')
+    if window < 1:
+        raise InputError('window should be a positive integer.')
+    return window if min_periods is None else min(min_periods, window)
+
+
+def _sliding_tail(x, alpha, window, min_periods):
+    """VaR and ES of every column of x over a sliding window of rows, as positive losses.
+
+    With n observations in the window and k = ceil(n*(1-alpha)), VaR is minus the k-th smallest and ES
+    minus the mean of the k smallest. Every column is ranked once and its ranks are stored in a wavelet
+    matrix with the sums of the values below each split, so the k-th smallest of any range of rows, and
+    the sum of everything smaller, takes one step per bit of the rank: O(log T) per date instead of a
+    sort of the window, with the steps of all dates and columns run together. Missing observations
+    rank last and never reach the tail.
+    """
+    t, c = x.shape
+    var = full((t, c), nan)
+    es = full((t, c), nan)
+    depth = max(int(t - 1).bit_length(), 1)
+    # bound the memory of the matrix by building it for a block of columns at a time
+    block = max(1, 2**24 // (depth*(t + 1)))
+    for start in range(0, c, block):
+        # columns as rows, so that every lookup below runs along contiguous memory
+        xb = x[:, start:start + block].T.copy()
+        m = len(xb)
+        order = argsort(xb, axis=1, kind='stable')
+        ranked = take_along_axis(xb, order, axis=1)
+        seq = empty((m, t), dtype=int)
+        put_along_axis(seq, order, arange(t), axis=1)
+        vals = where(isnan(xb), 0, xb)
+
+        # 1 the wavelet matrix: zero bits and the sums of their values before every row, at every level
+        n_zeros = zeros((depth, m, t + 1), dtype=int)
+        zero_sums = zeros((depth, m, t + 1))
+        for level in range(depth):
+            bit = ((seq >> (depth - 1 - level)) & 1).astype(uint8)
+            cumsum(bit == 0, axis=1, out=n_zeros[level, :, 1:])
+            cumsum(where(bit == 0, vals, 0), axis=1, out=zero_sums[level, :, 1:])
+            perm = argsort(bit, axis=1, kind='stable')
+            seq = take_along_axis(seq, perm, axis=1)
+            vals = take_along_axis(vals, perm, axis=1)
+
+        # 2 one descent for the windows of all dates
+        count = zeros((m, t + 1))
+        cumsum(~isnan(xb), axis=1, out=count[:, 1:])
+        hi = arange(1, t + 1)[None, :].repeat(m, axis=0)
+        lo = (hi - window).clip(0)
+        n = take_along_axis(count, hi, axis=1) - take_along_axis(count, lo, axis=1)
+        k = ceil(n*(1 - alpha) - 1e-9).clip(1)
+        kk = k - 1
+        below = zeros((m, t))
+        rank = zeros((m, t), dtype=int)
+        for level in range(depth):
+            zero_lo = take_along_axis(n_zeros[level], lo, axis=1)
+            zero_hi = take_along_axis(n_zeros[level], hi, axis=1)
+            zeros_in = zero_hi - zero_lo
+            right = kk >= zeros_in
+            below += where(right, take_along_axis(zero_sums[level], hi, axis=1)
+                           - take_along_axis(zero_sums[level], lo, axis=1), 0)
+            kk = where(right, kk - zeros_in, kk)
+            total = n_zeros[level, :, t:]
+            lo = where(right, total + lo - zero_lo, zero_lo)
+            hi = where(right, total + hi - zero_hi, zero_hi)
+            rank = 2*rank + right
+        kth = take_along_axis(ranked, rank.clip(max=t - 1), axis=1)
+        ready = n >= max(min_periods, 1)
+        var[:, start:start + block] = where(ready, -kth, nan).T
+        es[:, start:start + block] = where(ready, -(below + kth)/k, nan).T
+    return var, es
+
+
+def _weighted_tail(x, weights, alpha, window, min_periods, block=None):
+    """VaR and ES of every column of x with weights over the window (oldest first), as positive losses.
+
+    VaR is minus the return at which the cumulative weight of the sorted window reaches 1 - alpha, and
+    ES minus the weighted mean of the returns below it, the VaR return taking the part of its weight
+    that fills the tail to exactly 1 - alpha. Missing returns get no weight and the rest are
+    renormalized. Windows are sorted together, a block of rows at a time to bound memory.
+    """
+    t, c = x.shape
+    var = full((t, c), nan)
+    es = full((t, c), nan)
+    # every row ends a window, the first ones padded with missing returns; columns as rows, so that every
+    # window is contiguous
+    padded = hstack([full((c, window - 1), nan), x.T])
+    windows = sliding_window_view(padded, window, axis=1)
+    block = block or max(1, 2**22 // (c*window))
+    p = 1 - alpha
+    # the tail holds at most m observations, whatever the missing ones, so only those are sorted
+    m = int(min(window, ceil(p*weights.sum()/weights.min()) + 1))
+    for lo in range(0, t, block):
+        w = windows[:, lo:lo + block]
+        shape = w.shape[:2]
+        # one window per row, gathered from with flat indices
+        w = w.reshape(-1, window)
+        valid = ~isnan(w)
+        total = valid @ weights
+        keyed = where(valid, w, inf)
+        rows = arange(len(w))[:, None]
+        if m < window:
+            idx = argpartition(keyed, m - 1, axis=-1)[:, :m]
+            ws = keyed.take(rows*window + idx)
+        else:
+            idx, ws = arange(window)[None, :], keyed
+        sort = argsort(ws, axis=-1)
+        ws = ws.take(rows*ws.shape[1] + sort)
+        idx = idx.take(rows*idx.shape[1] + sort if m < window else sort)
+        found = ws < inf
+        ws = where(found, ws, 0)
+        with errstate(invalid='ignore', divide='ignore'):
+            wt = where(found, weights[idx], 0)/total[:, None]
+        cw = cumsum(wt, axis=-1)
+        at = (cw < p - 1e-12).sum(axis=-1).clip(max=m - 1)
+        kth = ws[rows[:, 0], at]
+        before = where(at > 0, cw[rows[:, 0], (at - 1).clip(0)], 0)
+        tail = where(arange(m) < at[:, None], ws*wt, 0).sum(axis=-1)
+        ready = (valid.sum(axis=-1) >= max(min_periods, 1))
+        var_ = where(ready, -kth, nan).reshape(shape)
+        es_ = where(ready, -(tail + (p - before)*kth)/p, nan).reshape(shape)
+        var[lo:lo + shape[1]] = var_.T
+        es[lo:lo + shape[1]] = es_.T
+    return var, es
+
+
+def _monte_carlo_chunk(factor, mean, positions, df, n, seed, k):
+    """The k smallest P&L of every book among n scenarios drawn from the stream of seed."""
+    rng = default_rng(seed)
+    ret = rng.standard_normal((n, len(mean))) @ factor.T
+    if df:
+        # multivariate t, scaled to the covariance of the normal scenarios
+        ret *= sqrt((df - 2)/rng.chisquare(df, n))[:, None]
+    pnl = (ret + mean) @ positions.T
+    k = min(k, n)
+    return partition(pnl, k - 1, axis=0)[:k]
+
+
+def _merge_tail(tail, part, k):
+    """The k smallest of every column of two tails."""
+    both = vstack([tail, part])
+    return both if len(both) <= k else partition(both, k - 1, axis=0)[:k]
+
+
+def _panels(data, var, es):
+    return (DataFrame(var, index=data.index, columns=data.columns),
+            DataFrame(es, index=data.index, columns=data.columns))
 
 
 class HistoricalVaR:
-    def pnl(self):
+    """
+    Historical VaR and ES of many P&L (or return) series at once, over a rolling window of the 
+    latest observations. Losses are positive numbers, and every method returns the VaR and ES panels 
+    of the same shape as the data, the row of a date using the window that ends on it.
+    """
+    def pnl(self, data: DataFrame, alpha: float = 0.99, window: int = 250, min_periods: int = None):
         """
         Take the alpha percentile of pnl data
+
+        With n observations in the window and k = ceil(n*(1-alpha)), VaR is the 
+        k-th largest loss and ES the mean of the k largest losses. Each column 
+        is ranked once into a wavelet matrix, built in O(T log T), from which 
+        the k-th smallest of a window and the sum below it take O(log T) per 
+        date instead of a new sort of the window, for all dates and columns at 
+        once.
+
+        Parameters
+        ----------
+        data : DataFrame
+            P&L or returns, one column per book.
+        alpha : float, optional
+            The confidence level. Default is 0.99.
+        window : int, optional
+            The number of rows in the window. Default is 250.
+        min_periods : int, optional
+            The minimum number of observations in the window. Default is window.
+
+        Returns
+        -------
+            (VaR, ES), two DataFrames aligned with data.
         """
-        pass
-    
+        min_periods = _check(alpha, window, min_periods)
+        var, es = _sliding_tail(data.to_numpy(dtype=float), alpha, window, min_periods)
+        return _panels(data, var, es)
+
     def x_weighted(self):
         pass
 
-    def age_weighted(self):
-        pass
+    def age_weighted(self, data: DataFrame, alpha: float = 0.99, window: int = 250, lambda_: float = 0.98,
+                     min_periods: int = None):
+        """
+        Age-weighted historical VaR and ES (Boudoukh, Richardson and Whitelaw, 1998): 
+        the observation i periods before the latest weighs lambda_**i, and the 
+        weights of the window are normalized to sum to one.
+
+        Parameters
+        ----------
+        data, alpha, window, min_periods
+            As in `pnl`.
+        lambda_ : float, optional
+            The decay of the weights. Default is 0.98.
+
+        Returns
+        -------
+            (VaR, ES), two DataFrames aligned with data.
+        """
+        min_periods = _check(alpha, window, min_periods)
+        weights = lambda_**arange(window - 1, -1, -1, dtype=float)
+        var, es = _weighted_tail(data.to_numpy(dtype=float), weights, alpha, window, min_periods)
+        return _panels(data, var, es)
+
+    def volatility_weighted(self, data: DataFrame, alpha: float = 0.99, window: int = 250,
+                            lambda_: float = 0.94, burnin: int = 20, min_periods: int = None):
+        """
+        Volatility-weighted historical VaR and ES (Hull and White, 1998): every 
+        observation is rescaled by the ratio of the latest EWMA volatility to its 
+        own, VaR and ES are taken as in `pnl` on the rescaled window. As the 
+        rescaling is common to a window, this is the sliding order statistic of 
+        the standardized observations times the latest volatility.
+
+        Parameters
+        ----------
+        data, alpha, window, min_periods
+            As in `pnl`.
+        lambda_ : float, optional
+            The decay factor of the EWMA variance. Default is 0.94.
+        burnin : int, optional
+            The number of observations seeding the EWMA variance, see 
+            `QuantFin.tool.EWMAVariance`. Default is 20.
+
+        Returns
+        -------
+            (VaR, ES), two DataFrames aligned with data.
+        """
+        min_periods = _check(alpha, window, min_periods)
+        x = data.to_numpy(dtype=float)
+        sigma2 = EWMAVariance(burnin, lambda_).update(data)[data.columns].to_numpy(dtype=float)
+        latest = where(isnan(x), sigma2, lambda_*sigma2 + (1 - lambda_)*x**2)
+        with errstate(invalid='ignore', divide='ignore'):
+            var, es = _sliding_tail(x/sqrt(sigma2), alpha, window, min_periods)
+        return _panels(data, var*sqrt(latest), es*sqrt(latest))
 
-    def volatility_weighted(self):
-        pass
 
 class NormalLinearVaR:
 
@@ -34,18 +273,114 @@ class NormalLinearVaR:
         """
 
 class MonteCarloVaR:
-    def monte_carlo(self):
-        pass
+    """
+    Monte Carlo VaR and ES of linear books on many assets, with returns drawn from a multivariate 
+    normal or Student-t distribution. The Cholesky factor of the covariance is computed once and 
+    cached for all simulations.
 
-class HistoricalES:
-    def pnl(self):
-        pass
+    Parameters
+    ----------
+    cov : DataFrame or array
+        The covariance of the asset returns over the horizon.
+    mean : Series or array, optional
+        The mean of the asset returns over the horizon. Default is zero.
+    df : float, optional
+        Degrees of freedom (> 2) of a Student-t distribution, scaled so that cov is still the 
+        covariance of the returns. Default is a normal distribution.
+    """
+    def __init__(self, cov, mean=None, df: float = None):
+        if df is not None and df <= 2:
+            raise InputError('df should be larger than 2 for the covariance to exist.')
+        self.assets = cov.columns if isinstance(cov, DataFrame) else None
+        self.cov = asarray(cov, dtype=float)
+        if mean is None:
+            mean = zeros(len(self.cov))
+        elif self.assets is not None and isinstance(mean, Series):
+            mean = mean.reindex(self.assets)
+        self.mean = asarray(mean, dtype=float)
+        self.df = df
+        self._factor = None
 
-    def age_weighted(self):
-        pass
+    @property
+    def factor(self):
+        """The cached Cholesky factor L of cov, with L @ L.T == cov. If cov is only semi-definite, it is
+        V*sqrt(W) from the eigendecomposition cov = V diag(W) V.T, negative eigenvalues clipped to zero."""
+        if self._factor is None:
+            try:
+                self._factor = cholesky(self.cov)
+            except LinAlgError:
+                values, vectors = eigh(self.cov)
+                self._factor = vectors*sqrt(values.clip(0))
+        return self._factor
 
-    def volatility_weighted(self):
-        pass
+    def monte_carlo(self, positions, alpha=0.99, n_sims: int = 1000000, chunk_size: int = 100000,
+                    seed: int = None, n_jobs: int = 1):
+        """
+        Simulate the P&L of books and take its VaR and ES.
+
+        Scenarios are drawn in chunks of chunk_size, each from its own child stream of 
+        numpy.random.SeedSequence(seed), and every chunk hands back only its smallest P&L. 
+        The running tail is merged chunk by chunk, so memory does not grow with n_sims, 
+        and the result is exact for the n_sims scenarios and identical for any n_jobs.
+
+        With k = ceil(n_sims*(1-alpha)), VaR is the k-th largest loss and ES the mean of 
+        the k largest losses.
+
+        Parameters
+        ----------
+        positions : Series or DataFrame
+            Holdings in the assets, a Series for one book or a DataFrame with a row for 
+            every book and a column for every asset.
+        alpha : float or list, optional
+            The confidence level, or a list of them. Default is 0.99.
+        n_sims : int, optional
+            The number of scenarios. Default is 1000000.
+        chunk_size : int, optional
+            The number of scenarios drawn at a time. Default is 100000.
+        seed : int, optional
+            The entropy of the SeedSequence. Default is fresh entropy.
+        n_jobs : int, optional
+            The number of processes drawing chunks. Default is 1.
+
+        Returns
+        -------
+            (VaR, ES), Series over books for one alpha, or DataFrames with a row for every 
+        alpha and a column for every book.
+        """
+        alphas = [alpha] if isinstance(alpha, (int, float)) else list(alpha)
+        if not all(0 < a < 1 for a in alphas):
+            raise InputError('alpha should be a confidence level between 0 and 1, e.g., 0.99.')
+        books = positions.to_frame().T if isinstance(positions, Series) else positions
+        if self.assets is not None:
+            books = books.reindex(columns=self.assets, fill_value=0)
+        holdings = books.to_numpy(dtype=float)
+        ks = [int(ceil(n_sims*(1 - a) - 1e-9)) or 1 for a in alphas]
+        k = max(ks)
+
+        sizes = [chunk_size]*(n_sims//chunk_size) + ([n_sims % chunk_size] if n_sims % chunk_size else [])
+        seeds = SeedSequence(seed).spawn(len(sizes))
+        jobs = [(self.factor, self.mean, holdings, self.df, n, child, k) for n, child in zip(sizes, seeds)]
+        tail = empty((0, len(books)))
+        if n_jobs > 1:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                for part in executor.map(_monte_carlo_chunk, *zip(*jobs)):
+                    tail = _merge_tail(tail, part, k)
+        else:
+            for job in jobs:
+                tail = _merge_tail(tail, _monte_carlo_chunk(*job), k)
+
+        tail.sort(axis=0)
+        var = DataFrame([-tail[j - 1] for j in ks], index=alphas, columns=books.index)
+        es = DataFrame([-tail[:j].sum(axis=0)/j for j in ks], index=alphas, columns=books.index)
+        if len(alphas) == 1 and isinstance(alpha, (int, float)):
+            return var.iloc[0], es.iloc[0]
+        return var, es
+
+class HistoricalES(HistoricalVaR):
+    """
+    Historical ES, returned together with the VaR of the same window by every method of 
+    `HistoricalVaR`.
+    """
 
 class NormalLinearES:
     def pnl(self):
@@ -1,14 +1,416 @@
 # -*- coding: utf-8 -*-
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from threading import Lock
 from linearmodels import (FamaMacBeth, PanelOLS)
-from pandas import concat, DataFrame
-from numpy import log, nan
-from QuantFin.HandleError import QueryError
+# _absorb_reg reuses PanelOLS' covariance estimators and rank check, which are not public API; the
+# linearmodels versions they are tested with are pinned in requirements.txt and SETUP.py
+from linearmodels.panel.covariance import (
+    ACCovariance, ClusteredCovariance, CovarianceManager, DriscollKraay, HeteroskedasticCovariance,
+    HomoskedasticCovariance, KERNEL_LOOKUP, kernel_optimal_bandwidth, setup_covariance_estimator)
+from linearmodels.panel.utility import check_absorbed
+from pandas import concat, DataFrame, Series, factorize
+from numpy import (abs as npabs, asarray, bincount, column_stack, diag, empty, errstate, full, isfinite,
+                   log, nan, ones, packbits, ptp, sqrt, zeros)
+from numpy.linalg import lstsq, matrix_rank, solve
+from scipy import stats as st
+from QuantFin.HandleError import InputError, QueryError
+
+class _FormulaPlan:
+    '''A compiled stata-like regression formula, e.g.
+    "y ~ 1 + x1##x2 + log(x3) if year >= 2000, fe(firmid year), cluster(firmid)".
+
+    It lists what a specification needs from the data: the dependent variable, the regressors in the
+    order of the formula, the derived regressors (constant, interactions and logs) with the raw columns
+    they are built from, the subsample query, the fixed effects, the clusters and the covariance
+    estimator.
+    '''
+    def __init__(self, formula):
+        self.formula = formula
+        self.fama_macbeth, self.fmb_backend = False, 'linearmodels'
+        self.effects, self.clusters = None, None
+        self.cov_type, self.kernel, self.bandwidth = 'unadjusted', None, None
+        self.query = None
+        self.derived = {}
+
+        dep, right = formula.split('~')
+        self.dep = dep.replace(' ', '')
+        parts = right.split(',')
+        if ' if ' in parts[0]:
+            parts[0], self.query = parts[0].split(' if ')
+        indeps = parts[0].replace(' ', '').split('+')
+
+        self.xvars = []
+        for indep in indeps:
+            if indep.lower() == '1' or 'const' in indep.lower() or 'intercept' in indep.lower():
+                self.derived['_cons'] = ('const', [])
+                self.xvars.append('_cons')
+
+            elif '##' in indep or '*' in indep:
+                indep = indep.replace('##', ' X ')
+                indep = indep.replace('*', ' X ')
+                interxs = indep.split(' X ')
+                self.derived[indep] = ('product', interxs)
+                self.xvars.append(indep)
+                self.xvars += interxs
+
+            elif (':' in indep or '#' in indep) and ('##' not in indep):
+                indep = indep.replace('#', ' X ')
+                indep = indep.replace(':', ' X ')
+                self.derived[indep] = ('product', indep.split(' X '))
+                self.xvars.append(indep)
+
+            elif 'log(' in indep:
+                logvar = indep[indep.find("(")+1:indep.find(")")]
+                self.derived[f'log({logvar})'] = ('log', [logvar])
+                self.xvars.append(indep)
+
+            else:
+                self.xvars.append(indep)
+
+        for _f in parts[1:]:
+
+            # handle fixed effects
+            if 'fe(' in _f:
+                self.effects = _f[_f.find("(")+1:_f.find(")")].split(' ')
+
+            # handle convariance estimators
+            elif 'cluster(' in _f:
+                self.cov_type = 'clustered'
+                self.clusters = _f[_f.find("(")+1:_f.find(")")].split(' ')
+
+            elif 'robust' in _f.lower() or 'heteroskedastic' in _f.lower():
+                self.cov_type = 'robust'
+
+            elif 'kernel' in _f.lower():
+                kernels = _f[_f.find("(")+1:_f.find(")")].split(' ')
+                if len(kernels) > 1:
+                    self.kernel, self.bandwidth = kernels[0], float(kernels[1])
+                else:
+                    self.kernel = kernels[0]
+                if self.kernel.lower() not in ['bartlett', 'parzen', 'qs']:
+                    raise InputError("The kernel should be 'bartlett', 'parzen' or 'qs'.")
+                self.cov_type = 'kernel'
+
+            # indicate if running in fama macbeth
+            elif 'famamacbeth' in _f.lower():
+                self.fama_macbeth = True
+                if '(' in _f:
+                    self.fmb_backend = _f[_f.find("(")+1:_f.find(")")].strip().lower()
+                    if self.fmb_backend not in ['linearmodels', 'native']:
+                        raise InputError("The backend of famamacbeth should be 'linearmodels' or 'native'.")
+
+    def columns(self, data):
+        '''The raw columns of data the specification needs.'''
+        needed = [self.dep] + [x for x in self.xvars if x not in self.derived]
+        for _, sources in self.derived.values():
+            needed += sources
+        needed += (self.effects or []) + (self.clusters or [])
+        if self.query:
+            needed += [col for col in data.columns if str(col) in self.query]
+        return list(dict.fromkeys(col for col in needed if col in data.columns))
+
+def _derive(data, kind, sources):
+    '''Build a derived regressor (constant, interaction or log) from the raw columns of data.'''
+    if kind == 'const':
+        return Series(1, index=data.index)
+    elif kind == 'product':
+        col = data[sources[0]].astype(float)
+        for source in sources[1:]:
+            col = col * data[source]
+        return col
+    return log(data[sources[0]])
+
+class _Results:
+    '''Estimates of the native estimators in this module, with the attributes of linearmodels' results
+    that are used here.'''
+    included_effects = []
+
+    def __init__(self, **res):
+        self.__dict__.update(res)
+
+class _BatchFamaMacBeth:
+    '''Fama-MacBeth regressions with all cross-sections estimated in one pass.
+
+    The per-period X'X and X'y are accumulated with bincount over the period codes and solved as one
+    stacked linear system, instead of one least-squares fit per period. The covariance of the average
+    slopes is the kernel (Newey-West by default) estimator on the time series of slopes. Estimates,
+    standard errors and R-squared match linearmodels' FamaMacBeth.
+
+    Parameters
+    ----------
+    dependent : Series
+        The dependent variable, indexed by (entity, time).
+    exog : DataFrame
+        The regressors, indexed by (entity, time).
+    weights : Series, optional
+        Weights of the cross-sectional WLS regressions.
+    '''
+    def __init__(self, dependent, exog, weights=None):
+        self.dependent, self.exog = dependent, exog
+        self.weights = weights
+
+    def fit(self, cov_type='unadjusted', debiased=True, bandwidth=None, kernel=None):
+        '''Estimate the model.
+
+        Parameters
+        ----------
+        cov_type : str, optional
+            'kernel' for a HAC covariance of the slopes; any other value uses the plain covariance of the
+        slopes.
+        debiased : bool, optional
+            Divide by T-1 instead of T and use the t distribution for p-values.
+        bandwidth : int, optional
+            The maximum lag of the kernel. Default is the optimal bandwidth of linearmodels.
+        kernel : str, optional
+            'bartlett' (Newey-West, default), 'parzen' or 'qs'.
+
+        Returns
+        -------
+            an object with params, std_errors, tstats, pvalues, cov, nobs, rsquared, rsquared_overall,
+        rsquared_within, avg_r2 and all_params (the slopes of every period).
+        '''
+        xvars = list(self.exog.columns)
+        y = asarray(self.dependent, dtype=float)
+        x = asarray(self.exog, dtype=float)
+        w = ones(len(y)) if self.weights is None else asarray(self.weights, dtype=float)
+        valid = isfinite(y) & isfinite(x).all(1) & isfinite(w)
+        y, x, w = y[valid], x[valid], w[valid]
+        index = self.exog.index[valid]
+        entities = factorize(index.get_level_values(0))[0]
+        periods, labels = factorize(index.get_level_values(1), sort=True)
+        n_periods, k = len(labels), x.shape[1]
+        root_w = sqrt(w)
+        wy, wx = root_w*y, root_w[:, None]*x
+
+        # 1 per-period cross products
+        xx = empty((n_periods, k, k))
+        for i in range(k):
+            for j in range(i, k):
+                xx[:, i, j] = xx[:, j, i] = bincount(periods, wx[:, i]*wx[:, j], minlength=n_periods)
+        xy = empty((n_periods, k))
+        for i in range(k):
+            xy[:, i] = bincount(periods, wx[:, i]*wy, minlength=n_periods)
+        n = bincount(periods, minlength=n_periods)
+        yy = bincount(periods, wy*wy, minlength=n_periods)
+        sy = bincount(periods, wy, minlength=n_periods)
+
+        # 2 one batched solve for the slopes of all well-posed periods
+        ok = (n >= k) & (matrix_rank(xx) == k)
+        slopes = full((n_periods, k), nan)
+        slopes[ok] = solve(xx[ok], xy[ok][..., None])[..., 0]
+        params = slopes[ok].mean(0)
+
+        has_constant = bool((x.shape[0] > 0) and ((x == x[0]).all(0) & (x[0] != 0)).any())
+        sse = yy - (slopes*xy).sum(1)
+        tss = yy - sy**2/n if has_constant else yy
+        with errstate(divide='ignore', invalid='ignore'):
+            r2 = 1 - sse/tss
+            adj_r2 = 1 - (sse/(n-k)) / (tss/(n-int(has_constant)))
+        avg_r2 = r2[ok].mean()
+
+        # 3 kernel covariance of the slope time series
+        e = slopes[ok] - params
+        t = e.shape[0]
+        kernel = 'bartlett' if kernel is None else kernel.lower()
+        if cov_type == 'kernel':
+            if bandwidth is None:
+                bandwidth = kernel_optimal_bandwidth((e / e.std(0)).sum(1), kernel)
+            lag_weights = KERNEL_LOOKUP[kernel](float(bandwidth), t - 1)
+        else:
+            lag_weights = KERNEL_LOOKUP[kernel](0, t - 1)
+        s = e.T @ e
+        for lag in range(1, min(len(lag_weights), t)):
+            gamma = e[lag:].T @ e[:-lag]
+            s += lag_weights[lag] * (gamma + gamma.T)
+        cov = s / t / (t - int(bool(debiased)))
+
+        # 4 pooled statistics at the average slopes
+        nobs = len(y)
+        mu = (w*y).sum() / w.sum() if has_constant else 0
+        weps = wy - wx @ params
+        rsquared = 1 - (weps @ weps) / (w * (y - mu)**2).sum()
+        ew = bincount(entities, w)
+        wyd = root_w * (y - (bincount(entities, w*y) / ew)[entities])
+        wxd = wx.copy()
+        for i in range(k):
+            wxd[:, i] = root_w * (x[:, i] - (bincount(entities, w*x[:, i]) / ew)[entities])
+        weps = wyd - wxd @ params
+        rsquared_within = 1 - (weps @ weps) / (wyd @ wyd)
+        rsquared_overall = rsquared
+        if has_constant and k == 1:
+            rsquared_overall, rsquared_within = 0., 0.
+        elif nobs == 1:
+            rsquared_within = 0.
+
+        std_errors = Series(sqrt(diag(cov)), index=xvars, name='std_error')
+        params = Series(params, index=xvars, name='parameter')
+        tstats = (params / std_errors).rename('tstat')
+        df_resid = nobs - k
+        if debiased:
+            pvalues = 2 * st.t.sf(npabs(tstats), df_resid)
+        else:
+            pvalues = 2 * st.norm.sf(npabs(tstats))
+        pvalues = Series(pvalues, index=xvars, name='pvalue')
+        present = n > 0
+        all_params = DataFrame(slopes[present], index=labels[present], columns=xvars)
+        all_params['r2'], all_params['adj_r2'] = r2[present], adj_r2[present]
+        return _Results(
+            params=params, std_errors=std_errors, tstats=tstats, pvalues=pvalues,
+            cov=DataFrame(cov, index=xvars, columns=xvars), nobs=nobs, df_resid=df_resid,
+            rsquared=rsquared, rsquared_overall=rsquared_overall, rsquared_within=rsquared_within,
+            avg_r2=avg_r2, all_params=all_params,
+        )
+
+class _Absorber:
+    '''The fixed effects of one estimation sample, absorbed by alternating projections.
+
+    Group codes and group sizes of every effect are computed once. Demeaned columns are memoized by
+    name, so that specifications sharing the sample and the effects only demean the columns that no
+    earlier specification has demeaned.
+
+    Parameters
+    ----------
+    effects : DataFrame
+        One column of group labels per fixed effect.
+    tol : float, optional
+        Stop iterating when no value moves by more than tol times the column's standard deviation, as
+    linearmodels does.
+    '''
+    def __init__(self, effects, tol=1e-8, max_iter=10000):
+        self.names = list(effects.columns)
+        self.codes = [factorize(effects[col])[0] for col in effects]
+        self.sizes = [bincount(code) for code in self.codes]
+        self.tol, self.max_iter = tol, max_iter
+        self._demeaned = {}
+        self._lock = Lock()
+
+    @property
+    def nunique(self):
+        return [len(size) for size in self.sizes]
+
+    def _project(self, values):
+        # one sweep over the effects, in place; returns how much every value moved
+        change = zeros(len(values))
+        for code, size in zip(self.codes, self.sizes):
+            mu = (bincount(code, values, minlength=len(size)) / size)[code]
+            values -= mu
+            change += mu
+        return change
+
+    def demean(self, name, values):
+        '''The values with all fixed effects removed, memoized by name.'''
+        with self._lock:
+            if name in self._demeaned:
+                return self._demeaned[name]
+        values = asarray(values, dtype=float)
+        if ptp(values) == 0:
+            current = zeros(len(values))
+        else:
+            current = values.copy()
+            self._project(current)
+            if len(self.codes) > 1:
+                scale = values.std(ddof=1)
+                for _ in range(self.max_iter):
+                    if npabs(self._project(current)).max() / scale <= self.tol:
+                        break
+        with self._lock:
+            self._demeaned[name] = current
+        return current
+
+def _absorb_key(plan, mask):
+    '''Specifications with the same effects, subsample query and non-missing rows share an _Absorber.'''
+    return tuple(plan.effects), plan.query, packbits(mask).tobytes()
+
+def _absorb_reg(plan, data, absorbers, cov_type, cov_config, debiased, count_effects, auto_df):
+    '''PanelOLS with fixed effects plan.effects, absorbed by a cached _Absorber instead of demeaning the
+    whole design matrix again for every specification. Estimates, covariances (all PanelOLS cov_types)
+    and R-squared follow linearmodels' PanelOLS.'''
+    dep, xvars = plan.dep, plan.xvars
+    y = data[dep].to_numpy(dtype=float)
+    x = data[xvars].to_numpy(dtype=float)
+    mask = isfinite(y) & isfinite(x).all(1) & data[plan.effects].notna().all(1).to_numpy()
+    key = _absorb_key(plan, mask)
+    if key not in absorbers:
+        absorbers[key] = _Absorber(data.loc[mask, plan.effects])
+    absorber = absorbers[key]
+    y, x = y[mask], x[mask]
+    index = data.index[mask]
+    nobs, nvar = x.shape
+
+    # 1 within transformation; like PanelOLS the grand means are added back with a constant
+    has_constant = bool(((x == x[0]).all(0) & (x[0] != 0)).any()) if nobs else False
+    wy = absorber.demean(dep, y)
+    wx = column_stack([absorber.demean(var, x[:, i]) for i, var in enumerate(xvars)])
+    ybar = y.mean()
+    if has_constant:
+        wy, wx = wy + ybar, wx + x.mean(0)
+    check_absorbed(wx, xvars)
+    params = lstsq(wx, wy, rcond=None)[0]
+
+    neffects, drop_first = 0, has_constant
+    for nunique in absorber.nunique:
+        neffects += nunique - drop_first
+        drop_first = True
+    df_resid = nobs - (nvar + neffects)
+
+    # 2 covariance
+    entity_ids = factorize(index.get_level_values(0))[0][:, None]
+    time_ids = factorize(index.get_level_values(1), sort=True)[0][:, None]
+    cov_config = dict(cov_config)
+    if 'clusters' in cov_config:
+        clusters = cov_config['clusters'][mask]
+        cov_config['clusters'] = column_stack([factorize(clusters[col])[0] for col in clusters])
+    if auto_df:
+        # PanelOLS always counts other effects in the degrees of freedom
+        count_effects = True
+    estimators = CovarianceManager(
+        'PanelOLS', HomoskedasticCovariance, HeteroskedasticCovariance, ClusteredCovariance,
+        DriscollKraay, ACCovariance)
+    cov = setup_covariance_estimator(
+        estimators, cov_type, wy[:, None], wx, params[:, None], entity_ids, time_ids,
+        debiased=debiased, extra_df=neffects if count_effects else 0, **cov_config).cov
+
+    # 3 R-squared
+    weps = wy - wx @ params
+    resid_ss = weps @ weps
+    mu = ybar if has_constant else 0
+    total_ss = (wy - mu) @ (wy - mu)
+    rsquared = 1 - resid_ss / total_ss if total_ss > 0 else 0.
+    if has_constant and nvar == 1:
+        rsquared_overall, rsquared_within = 0., 0.
+    else:
+        eps = y - x @ params
+        total_ss = ((y - mu)**2).sum()
+        rsquared_overall = 1 - (eps @ eps) / total_ss if total_ss > 0 else 0.
+        entities, counts = entity_ids[:, 0], bincount(entity_ids[:, 0])
+        yd = y - (bincount(entities, y) / counts)[entities]
+        xd = column_stack([x[:, i] - (bincount(entities, x[:, i]) / counts)[entities] for i in range(nvar)])
+        eps = yd - xd @ params
+        total_ss = yd @ yd
+        rsquared_within = 1 - (eps @ eps) / total_ss if total_ss > 0 else 0.
+        if nobs == 1:
+            rsquared_within = 0.
+
+    std_errors = Series(sqrt(diag(cov)), index=xvars, name='std_error')
+    params = Series(params, index=xvars, name='parameter')
+    tstats = (params / std_errors).rename('tstat')
+    if debiased:
+        pvalues = 2 * st.t.sf(npabs(tstats), df_resid)
+    else:
+        pvalues = 2 * st.norm.sf(npabs(tstats))
+    return _Results(
+        params=params, std_errors=std_errors, tstats=tstats, pvalues=Series(pvalues, index=xvars, name='pvalue'),
+        cov=DataFrame(cov, index=xvars, columns=xvars), nobs=nobs, df_resid=df_resid,
+        rsquared=rsquared, rsquared_overall=rsquared_overall, rsquared_within=rsquared_within,
+        included_effects=[f'Other Effect ({name})' for name in absorber.names],
+    )
 
 def _panel_reg(
         formula, data, weights=None, singletons=True, drop_absorbed=False, check_rank=True, 
         use_lsdv=False, use_lsmr=False, low_memory=None, debiased=True, count_effects=True, 
-        bandwidth=None, kernel=None
+        bandwidth=None, kernel=None, absorbers=None
         ):
     '''This is a Python function that handles panel regression using various fixed effects and
     covariance estimators.
@@ -18,9 +420,10 @@ def _panel_reg(
     formula
         The formula for the regression model in the form of a string, with the dependent variable on
     the left side of the tilde (~) and the independent variables on the right side separated by plus
-    signs (+).
+    signs (+), or a compiled _FormulaPlan.
     data
-        The data on which the regression is to be performed.
+        The data on which the regression is to be performed. Derived regressors missing from data are
+    added to it.
     weights
         Weights are used to adjust the contribution of each observation in the regression analysis.
     They can be used to account for differences in sample sizes or to give more weight to certain
@@ -64,98 +467,51 @@ def _panel_reg(
     kernel
         The type of kernel to use for kernel-based covariance estimation. Possible values are
     'bartlett', 'parzen', and 'qs'.
+    absorbers, optional
+        A dict of cached fixed-effect structures shared by specifications. Unweighted fe() models are
+    estimated by absorbing the effects with the cached structure of their sample instead of by
+    PanelOLS; multiregs passes one dict to all its specifications.
     
     Returns
     -------
-        either a FamaMacBeth or a PanelOLS object depending on the value of the fama_macbeth variable.
+        either a FamaMacBeth (or _BatchFamaMacBeth results with "famamacbeth(native)") or a PanelOLS object
+    depending on the value of the fama_macbeth variable.
     
     '''
-    fama_macbeth = False
-    entity_effects, time_effects, other_effects = False, False, None
-    cov_type, cov_config = 'unadjusted', {}
-
-    # 1 handle formula
-    dep, right = formula.split('~')
-    dep = dep.replace(' ', '')
-    formulas = right.split(',')
-    if ' if ' in formulas[0]:
-        formulas[0], data_query = formulas[0].split(' if ')
-        data.query(data_query, inplace=True)
+    plan = formula if isinstance(formula, _FormulaPlan) else _FormulaPlan(formula)
+    for name, (kind, sources) in plan.derived.items():
+        if name not in data.columns:
+            data[name] = _derive(data, kind, sources)
+    if plan.query:
+        data = data.query(plan.query)
         if data.empty:
             raise QueryError("""Return a empty dataframe after Query""")
-    indeps = formulas[0].replace(' ', '').split('+')
-
-    # 2 handle right-hand variables
-    xvars = []
-    for indep in indeps:
-        if indep.lower() == '1' or 'const' in indep.lower() or 'intercept' in indep.lower():
-            data.loc[:, '_cons'] = 1
-            xvars.append('_cons')
-
-        elif '##' in indep or '*' in indep:
-            indep = indep.replace('##', ' X ')
-            indep = indep.replace('*', ' X ')
-            interxs = indep.split(' X ')
-            data.loc[:, indep] = 1
-            for interx in interxs:
-                data.loc[:, indep] *= data.loc[:, interx]
-            xvars.append(indep)
-            xvars += interxs
-
-        elif (':' in indep or '#' in indep) and ('##' not in indep):
-            indep = indep.replace('#', ' X ')
-            indep = indep.replace(':', ' X ')
-            data[indep] = 1
-            for interx in indep.split(' X '):
-                data[indep] *= data[interx]
-            xvars.append(indep)
-
-        elif 'log(' in indep:
-            logvar = indep[indep.find("(")+1:indep.find(")")]
-            data[f'log({logvar})'] = log(data[logvar])
-            xvars.append(indep)
 
-        else:
-            xvars.append(indep)
-
-    if len(formulas) > 1:
-        for _f in formulas:
-
-            # 3 handle fixed effects
-            if 'fe(' in _f:
-                var_effects = _f[_f.find("(")+1:_f.find(")")].split(' ')
-                other_effects = data[var_effects]
-
-            # 4 handle convariance estimators
-            elif 'cluster(' in _f:
-                cov_type = 'clustered'
-                var_effects = _f[_f.find("(")+1:_f.find(")")].split(' ')
-                clusters = data[var_effects]
-                cov_config.update({'clusters': clusters})
-
-            elif 'robust' in _f.lower() or 'heteroskedastic' in _f.lower():
-                cov_type = 'robust'
-
-            elif 'kernel' in _f.lower():
-                kernels = _f[_f.find("(")+1:_f.find(")")].split(' ')
-                if len(kernels) > 1:
-                    kernel, bandwidth = kernels
-                    cov_config['bandwidth'] = bandwidth
-                else:
-                    kernel = kernels[0]
-                if kernel.lower() not in ['bartlett', 'parzen', 'qs']:
-                    pass  # raise error
-                cov_type = 'kernel'
-                cov_config['kernel'] = kernel
-
-            # 5 indicate if running in fama macbeth
-            elif 'famamacbeth' in _f.lower():
-                fama_macbeth = True
+    dep, xvars, fama_macbeth, cov_type = plan.dep, plan.xvars, plan.fama_macbeth, plan.cov_type
+    entity_effects, time_effects, other_effects = False, False, None
+    cov_config = {}
+    if plan.effects:
+        other_effects = data[plan.effects]
+    if plan.clusters:
+        cov_config['clusters'] = data[plan.clusters]
+    if plan.kernel:
+        kernel = plan.kernel
+        cov_config['kernel'] = kernel
+        if plan.bandwidth:
+            bandwidth = plan.bandwidth
+            cov_config['bandwidth'] = bandwidth
 
     if fama_macbeth:
+        if plan.fmb_backend == 'native':
+            return _BatchFamaMacBeth(data[dep], data[xvars], weights=weights).fit(
+                cov_type=cov_type, debiased=debiased, bandwidth=bandwidth, kernel=kernel)
         return FamaMacBeth(
             data[dep], data[xvars], weights=weights, check_rank=check_rank,
         ).fit(cov_type=cov_type, debiased=debiased, bandwidth=bandwidth, kernel=kernel)
+    elif (plan.effects and weights is None and singletons and not drop_absorbed
+          and not use_lsdv and not use_lsmr):
+        absorbers = {} if absorbers is None else absorbers
+        return _absorb_reg(plan, data, absorbers, cov_type, cov_config, debiased, count_effects, debiased)
     else:
         return PanelOLS(
             data[dep], data[xvars], 
@@ -227,7 +583,21 @@ def _get_results(model, model_label, dep_label, decimal_coef, decimal_tvalue, de
     _stats = _stats.rename(model_label).to_frame()
     return _stats
 
-def multiregs(formulas, data, entity_label, time_label, decimal_coef: int = 2, decimal_tvalue: int = 2, decimal_rsquared: int = 2, coef_in_percentage: bool = True, varname_in_cap: bool = False, **kwargs):
+def _design_data(plan, data, derived):
+    '''The data of one specification: its raw columns plus its derived regressors from the shared cache.'''
+    _data = data[plan.columns(data)]
+    return _data.assign(**{name: derived[name] for name in plan.derived})
+
+def _run_reg(model_label, plan, data, result_args, kwargs, absorbers=None):
+    print('Running Regression', model_label)
+    model = _panel_reg(plan, data, absorbers=absorbers, **kwargs)
+    return _get_results(model, model_label, plan.dep, *result_args)
+
+def _run_design(model_label, plan, data, derived, result_args, kwargs, absorbers=None):
+    '''_run_reg on the design data of plan, built only when the regression runs.'''
+    return _run_reg(model_label, plan, _design_data(plan, data, derived), result_args, kwargs, absorbers)
+
+def multiregs(formulas, data, entity_label, time_label, decimal_coef: int = 2, decimal_tvalue: int = 2, decimal_rsquared: int = 2, coef_in_percentage: bool = True, varname_in_cap: bool = False, n_jobs: int = 1, backend: str = 'thread', **kwargs):
     '''The function `multiregs` performs multiple regressions on panel data and returns the results in a
     formatted DataFrame.
     Special features:
@@ -235,6 +605,9 @@ def multiregs(formulas, data, entity_label, time_label, decimal_coef: int = 2, d
             "y ~ 1 + x1 + x2 if 2010<=year<=2020, fe(firmid year month), cluster(firmid)"
             "y ~ 1 + x1 + x2 if 2010<=year<=2020, fe(firmid year month), robust"
             "y ~ 1 + x1 + x2 if 2010<=year<=2020, famamacbeth, robust"
+            "y ~ 1 + x1 + x2 if 2010<=year<=2020, famamacbeth(native), kernel(bartlett 6)"
+       "famamacbeth(native)" estimates all cross-sections in one vectorized pass instead of through
+       linearmodels' FamaMacBeth.
     2. Return academic-like table summarising statistical results.
     
     Parameters
@@ -263,6 +636,13 @@ def multiregs(formulas, data, entity_label, time_label, decimal_coef: int = 2, d
         This parameter determines whether variable names should be displayed in capital letters or not. If
     set to True, variable names will be displayed in capital letters. If set to False, variable names
     will be displayed as they are in the data.
+    n_jobs : int, optional
+        The number of regressions to run at the same time. Every regression gets a copy of only the
+    columns its formula references; derived regressors (constant, interactions, logs) are computed
+    once for all formulas, and so are the fixed-effect structures and demeaned columns of
+    specifications with the same fe() and sample (except with backend='process'). Results are collected in the order of formulas. Default is 1.
+    backend : str, optional
+        Run regressions in a pool of 'thread's or 'process'es when n_jobs > 1. Default is 'thread'.
     
     Returns
     -------
@@ -275,14 +655,39 @@ def multiregs(formulas, data, entity_label, time_label, decimal_coef: int = 2, d
     if not [entity_label, time_label] == data.index.names:
         data = data.set_index([entity_label, time_label], drop=False)
 
+    result_args = (decimal_coef, decimal_tvalue, decimal_rsquared, coef_in_percentage, varname_in_cap)
+    plans = {i: _FormulaPlan(formulas[i]) for i in formulas}
+    # derived regressors shared by specifications are built only once
+    derived = {}
+    for plan in plans.values():
+        for name, (kind, sources) in plan.derived.items():
+            if name not in derived:
+                derived[name] = _derive(data, kind, sources)
+    # fixed effects of the same sample are prepared once and shared too, within this process
+    absorbers = None if n_jobs > 1 and backend == 'process' else {}
+    if n_jobs > 1:
+        if backend not in ['thread', 'process']:
+            raise InputError("The arg of backend should be 'thread' or 'process'.")
+        # design data are built as regressions are submitted, at most 2*n_jobs at a time: threads build
+        # their own from the shared data, processes get them built here so that only they are pickled
+        results = []
+        pool = ThreadPoolExecutor if backend == 'thread' else ProcessPoolExecutor
+        with pool(max_workers=n_jobs) as executor:
+            pending = deque()
+            for i in formulas:
+                if backend == 'thread':
+                    job = (_run_design, i, plans[i], data, derived, result_args, kwargs, absorbers)
+                else:
+                    job = (_run_reg, i, plans[i], _design_data(plans[i], data, derived), result_args, kwargs, absorbers)
+                pending.append(executor.submit(*job))
+                if len(pending) >= 2*n_jobs:
+                    results.append(pending.popleft().result())
+            results.extend(future.result() for future in pending)
+    else:
+        results = (_run_design(i, plans[i], data, derived, result_args, kwargs, absorbers) for i in formulas)
+
     stats = DataFrame()
-    for i in formulas:
-        print('Running Regression', i)
-        _data = data.copy()
-        model = _panel_reg(formulas[i], _data, **kwargs)
-        del _data
-        dep = formulas[i].replace(' ', '').split('~')[0]
-        _stats = _get_results(model, i, dep, decimal_coef, decimal_tvalue, decimal_rsquared, coef_in_percentage, varname_in_cap)
+    for _stats in results:
         stats = stats.merge(_stats, how='outer',
                             right_index=True, left_index=True)
     
@@ -1,10 +1,11 @@
 # -*- coding: utf-8 -*-
-from numpy import ones, nan
-from pandas import DataFrame, DatetimeIndex, concat, qcut
+from numpy import array, bincount, errstate, full, isnan, minimum, ones, nan, zeros
+from pandas import DataFrame, DatetimeIndex, Index, Series, concat, factorize, qcut
 
 from QuantFin._deciles import *
+from QuantFin._deciles import _grouped_quantiles, _shift_by_period, _sort_within_periods
 from QuantFin.HandleError import InputError
-from QuantFin._regression import OLS
+from QuantFin._regression import BatchOLS, RollingOLS
 from QuantFin.ReqData import KenFrenchLib
 
 
@@ -43,6 +44,8 @@ class Performance:
                 )
         self.df = data
         self.models = models
+        # summary() joins factor data onto df, so the portfolios are the columns given here
+        self.portfolios = list(data.columns)
         if freq.lower() in ['d', 'day', 'daily']:
             self.freq = 'D'
             self.ann_fac = 252
@@ -73,7 +76,7 @@ class Performance:
         return _f
 
     def _stats(self, ys, x, param, percentage, decimal, annualise, **args):
-        _tp = ys.apply(lambda y: OLS(y, x, **args).stats(param))
+        _tp = BatchOLS(ys, x, **args).stats(param)
         _m = _tp.iloc[0, :]
         if percentage:
             _m = _m*100
@@ -151,8 +154,73 @@ class Performance:
         _t.index = _t.index.rename('Portfolio')
         return _t
 
+    def _model_factors(self, model):
+        if model.lower() == 'capm':
+            if 'Mkt-RF' in self.df.columns:
+                return self.df[['Mkt-RF']]
+            return self._get_factor_data('FF3')[['Mkt-RF']]
+        return self._get_factor_data(model)
 
-def cal_portfolio_returns(panel_data: DataFrame, ret_label: str, time_label: str, port_label: str = None, weight_on: str = None) -> DataFrame:
+    def rolling(self, window: int = 60, min_periods: int = None, models: list = None) -> DataFrame:
+        """
+        It estimates alphas and factor loadings of all portfolios over a 
+        rolling (or expanding) window, e.g., 60-month alphas. Windowed 
+        cross-product sums are updated as the window slides instead of 
+        refitting every window, and all portfolios are solved together.
+
+        Parameters
+        ----------
+        window: int
+        The number of periods in a window. None for expanding windows from 
+        the first period. Default is 60.
+
+        min_periods: int
+        The minimum number of non-missing periods for a window to be 
+        estimated. Default is window (the number of regressors + 1 for 
+        expanding windows).
+
+        models: list
+        The benchmark asset pricing models, e.g., ['CAPM', 'FF3']. Default 
+        is the models of this Performance.
+
+        Returns
+        -------
+        rolling: DataFrame
+        Indexed by the end of windows, with columns of (model, stat, 
+        portfolio, param), where stat is 'coef' or 'tstat' (nonrobust) and 
+        param is 'const' (alpha) or a factor.
+        """
+        models = models or self.models
+        if not models:
+            raise InputError("The arg of 'models' is required for estimating alphas.")
+        factors = {model: self._model_factors(model) for model in models}
+        _fc = set().union(*[_f.columns for _f in factors.values()])
+        _l = [c for c in self.portfolios if c not in _fc]  # portfolio-label names
+
+        _r = {}
+        for model, _f in factors.items():
+            _d = concat([self.df[_l], _f], axis=1, join='inner')
+            _m = RollingOLS(_d[_l], _d[_f.columns], window=window, min_periods=min_periods)
+            _r[model] = concat([_m.params, _m.tvalues], axis=1, keys=['coef', 'tstat'])
+        _r = concat(_r, axis=1, names=['model', 'stat', 'Portfolio', 'param'])
+        _r.index = _r.index.rename(self.time_label)
+        return _r
+
+
+_SCHEMES = ['ew', 'vw', 'lvw', 'cvw']
+
+
+def _cap_by_period(periods, weights, cap):
+    '''Cap weights at the `cap` quantile of the weights in their period.'''
+    ok = ~isnan(weights) & (periods >= 0)
+    codes, uniques = factorize(periods[ok])
+    _, _, s, starts, ends = _sort_within_periods(codes, weights[ok])
+    limits = full(periods.max(initial=-1)+1, nan)
+    limits[uniques] = _grouped_quantiles(s, starts, ends, array([cap]))[:, 0]
+    return minimum(weights, limits[periods])
+
+
+def cal_portfolio_returns(panel_data: DataFrame, ret_label: str, time_label: str, port_label: str or Series = None, weight_on: str = None, schemes: list = None, entity_label: str = None, cap: float = 0.8) -> DataFrame:
     '''This function calculates portfolio returns based on input data and specified parameters.
     
     Parameters
@@ -164,38 +232,85 @@ def cal_portfolio_returns(panel_data: DataFrame, ret_label: str, time_label: str
     time_label : str
         The name of the column in the panel_data DataFrame that represents the time period of each
     observation.
-    port_label : str
-        The label for the portfolio column in the output DataFrame. If not provided, the function will
+    port_label : str or Series
+        The label of the portfolio column, or a Series of portfolio numbers aligned with panel_data (e.g.
+    from `univariate_sorting(..., return_series=True)`). If not provided, the function will
     return a Series instead of a DataFrame.
     weight_on : str
         The column name of the weights to be used for calculating value-weighted returns.
+    schemes : list
+        The weighting schemes to calculate in one pass, any of 'ew' (equal-weighted), 'vw' (weighted on
+    weight_on), 'lvw' (weighted on weight_on of the same entity in the previous period, so that entities
+    without an observation there get no weight) and 'cvw' (weighted on weight_on capped at its `cap`
+    quantile in every period). If not provided, the function calculates 'vw' if weight_on is given and
+    'ew' otherwise.
+    entity_label : str
+        The name of the entity column, required by 'lvw'.
+    cap : float
+        The quantile at which weights are capped in 'cvw'. Default is 0.8.
     
     Returns
     -------
         a DataFrame that calculates portfolio returns based on the input parameters. The returned DataFrame
     contains the portfolio returns grouped by the specified time and portfolio labels. If a weight label
-    is specified, the portfolio returns are calculated using value-weighted returns.
+    is specified, the portfolio returns are calculated using value-weighted returns. If schemes are
+    given, columns are labelled by (scheme, portfolio), or by scheme without portfolios.
     
     '''
-    _l = [time_label]
-    if port_label:
-        _l = [port_label] + _l
-    if weight_on:
-        panel_data = panel_data[[ret_label, weight_on] + _l]
-        panel_data.loc[:, weight_on] = panel_data.loc[:, ret_label] / \
-            panel_data.loc[:, ret_label] * panel_data.loc[:, weight_on]
-        value_weight = panel_data.groupby(_l)[weight_on]\
-            .sum().rename('vw').reset_index()
-        panel_data = panel_data.merge(value_weight, on=_l, how='left')
-        panel_data['vw'] = panel_data[weight_on] / \
-            panel_data['vw'] * panel_data[ret_label]
-        if port_label:
-            return panel_data.groupby(_l)['vw'].sum().unstack().T.replace(0, nan)
-        else:
-            return panel_data.groupby(_l)['vw'].sum().replace(0, nan)
+    single = schemes is None
+    if single:
+        schemes = ['vw'] if weight_on else ['ew']
+    if not set(schemes) <= set(_SCHEMES):
+        raise InputError(f"The arg of schemes should be a list of {_SCHEMES}.")
+    if weight_on is None and set(schemes) - {'ew'}:
+        raise InputError("The arg of weight_on is required for the 'vw', 'lvw' and 'cvw' schemes.")
+    if entity_label is None and 'lvw' in schemes:
+        raise InputError("The arg of entity_label is required for the 'lvw' scheme.")
+
+    periods, times = factorize(panel_data[time_label], sort=True)
+    if port_label is None:
+        ports, port_names, port_name = zeros(len(panel_data), dtype=int), [None], None
     else:
-        panel_data = panel_data[[ret_label] + _l]
-        if port_label:
-            return panel_data.groupby(_l)[ret_label].mean().unstack().T
+        port = panel_data[port_label] if isinstance(port_label, str) else port_label
+        ports, port_names = factorize(port, sort=True)
+        port_name = port.name
+    n_t, n_p = len(times), len(port_names)
+    grouped = (periods >= 0) & (ports >= 0)
+    codes = ports*n_t + periods
+    ret = panel_data[ret_label].to_numpy(dtype=float)
+    valid = grouped & ~isnan(ret)
+
+    def _reduce(weights=None):
+        ok = valid if weights is None else valid & ~isnan(weights)
+        total = bincount(codes[ok], weights=None if weights is None else weights[ok], minlength=n_p*n_t)
+        wret = ret[ok] if weights is None else weights[ok]*ret[ok]
+        with errstate(invalid='ignore', divide='ignore'):
+            return (bincount(codes[ok], weights=wret, minlength=n_p*n_t) / total).reshape(n_p, n_t).T
+
+    if weight_on:
+        weights = panel_data[weight_on].to_numpy(dtype=float)
+    rets = {}
+    for scheme in schemes:
+        if scheme == 'ew':
+            rets[scheme] = _reduce()
+        elif scheme == 'vw':
+            rets[scheme] = _reduce(weights)
+        elif scheme == 'lvw':
+            rets[scheme] = _reduce(_shift_by_period(
+                panel_data[entity_label], panel_data[time_label], weights, 1, fill=nan))
         else:
-            return panel_data.groupby(_l)[ret_label].mean()
+            rets[scheme] = _reduce(_cap_by_period(periods, weights, cap))
+
+    # keep only periods with at least one portfolio observation
+    present = bincount(periods[grouped], minlength=n_t) > 0
+    index = Index(times, name=time_label)[present]
+    if port_label is None:
+        rets = DataFrame({k: v[present, 0] for k, v in rets.items()}, index=index)
+        if single:
+            return rets.iloc[:, 0].rename('vw' if weight_on else ret_label)
+        return rets
+    rets = {k: DataFrame(v[present], index=index, columns=Index(port_names, name=port_name))
+            for k, v in rets.items()}
+    if single:
+        return rets[schemes[0]]
+    return concat(rets, axis=1, names=['scheme'])
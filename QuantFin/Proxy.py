@@ -1,9 +1,248 @@
 # -*- coding: utf-8 -*-
-from numpy import exp, log, nan
-from pandas import (DataFrame, Series, concat, merge, qcut, read_csv,
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from numpy import (arange, argsort, bincount, column_stack, diff, empty, errstate, exp, full, isnan, log, nan,
+                   nan_to_num, ones, searchsorted, sign, sqrt, where)
+from numpy.linalg import matrix_rank, solve
+from pandas import (DataFrame, PeriodIndex, Series, concat, factorize, merge, qcut, read_csv,
                     to_datetime)
+from pandas.api.types import is_datetime64_any_dtype, is_numeric_dtype
 from pandas.tseries.offsets import BMonthEnd
 
+from QuantFin.HandleError import InputError
+from QuantFin.ReqData import KenFrenchLib
+from QuantFin.tool import _compound, _log_prefix_sums, _prefix_sum
+
+def _entity_chunks(data_set, entity, chunk_size):
+    '''Split a panel into pieces holding the rows of chunk_size entities each. Anything but a DataFrame
+    is taken as an iterable of such pieces already, e.g., a daily file read shard by shard.'''
+    if not isinstance(data_set, DataFrame):
+        yield from data_set
+        return
+    if not chunk_size:
+        yield data_set
+        return
+    codes = factorize(data_set[entity])[0]
+    shard = codes // chunk_size
+    order = argsort(shard, kind='stable')
+    bounds = searchsorted(shard[order], arange(shard.max() + 2 if len(shard) else 0))
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        if hi > lo:
+            yield data_set.iloc[order[lo:hi]]
+
+def _map_chunks(func, chunks, n_jobs, *args):
+    '''Apply func(chunk, *args) to every chunk, in a pool of n_jobs processes with at most 2*n_jobs chunks
+    in flight, and stack the results.'''
+    results = []
+    if n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(func, chunk, *args))
+                if len(pending) >= 2*n_jobs:
+                    results.append(pending.popleft().result())
+            results.extend(future.result() for future in pending)
+    else:
+        results = [func(chunk, *args) for chunk in chunks]
+    return concat(results, ignore_index=True)
+
+def _month_end(dates):
+    return dates.dt.to_period('M').dt.to_timestamp() + BMonthEnd()
+
+def _max_ret(data_set, entity, date, on, maxn):
+    _temp_set = data_set[[entity, date, on]].dropna(subset=[on])
+    _temp_set['jdate'] = _month_end(_temp_set[date])
+    # the largest returns of each month come first, ties in date order as with nlargest
+    _temp_set = _temp_set.sort_values([entity, 'jdate', on, date], ascending=[True, True, False, True])
+    _temp_set['rank'] = _temp_set.groupby([entity, 'jdate'], sort=False).cumcount() + 1
+    _temp_set = _temp_set[_temp_set['rank'] <= maxn]
+    df = _temp_set.set_index([entity, 'jdate', 'rank'])[[date, on]].unstack('rank')
+    df = df.reindex(columns=[(col, i) for i in range(1, maxn + 1) for col in (date, on)])
+    df.columns = [f'max{i}_{"date" if col == date else "ret"}' for col, i in df.columns]
+    return df.reset_index()
+
+def _idiosyncratic(data_set, entity, date, on, factors, min_obs):
+    # one regression of daily excess returns on the factors per entity-month: X'X and X'y of all of them
+    # are accumulated with bincount and solved as one stacked system; residuals come from the stacked
+    # slopes, and their moments from bincount again
+    _temp_set = data_set[[entity, date, on]].dropna()
+    loc = factors.index.get_indexer(_temp_set[date])
+    _temp_set = _temp_set[loc >= 0]
+    loc = loc[loc >= 0]
+    _temp_set['jdate'] = _month_end(_temp_set[date])
+    grouped = _temp_set.groupby([entity, 'jdate'])
+    groups = grouped.ngroup().to_numpy()
+    df = grouped.size().rename('nobs').reset_index()
+    n_groups = len(df)
+
+    rf = factors['RF'].to_numpy(dtype=float)[loc] if 'RF' in factors else 0
+    y = _temp_set[on].to_numpy(dtype=float) - rf
+    x = factors.drop(columns='RF', errors='ignore').to_numpy(dtype=float)[loc]
+    x = column_stack([ones(len(y)), x])
+    k = x.shape[1]
+
+    xx = empty((n_groups, k, k))
+    for i in range(k):
+        for j in range(i, k):
+            xx[:, i, j] = xx[:, j, i] = bincount(groups, x[:, i]*x[:, j], minlength=n_groups)
+    xy = empty((n_groups, k))
+    for i in range(k):
+        xy[:, i] = bincount(groups, x[:, i]*y, minlength=n_groups)
+    n = df['nobs'].to_numpy()
+    ok = (n >= max(min_obs, k + 1)) & (matrix_rank(xx) == k)
+    slopes = full((n_groups, k), nan)
+    slopes[ok] = solve(xx[ok], xy[ok][..., None])[..., 0]
+
+    e = y - (x*slopes[groups]).sum(1)
+    ssr = bincount(groups, e**2, minlength=n_groups)
+    with errstate(divide='ignore', invalid='ignore'):
+        df['IVOL'] = sqrt(ssr/(n - k))
+        df['ISKEW'] = bincount(groups, e**3, minlength=n_groups)/n / (ssr/n)**1.5
+    return df[[entity, 'jdate', 'IVOL', 'ISKEW', 'nobs']]
+
+def _read_chunks(source, columns, chunksize):
+    '''Chunks of a daily panel: a CSV or Parquet file read chunksize rows (Parquet record batches) at a
+    time, a DataFrame cut into pieces of chunksize rows, or any iterable of DataFrames as they are.'''
+    if isinstance(source, str):
+        if source.lower().endswith(('.parquet', '.pq')):
+            try:
+                from pyarrow.parquet import ParquetFile
+            except ImportError:
+                raise InputError('Reading Parquet files in chunks needs pyarrow.')
+            for batch in ParquetFile(source).iter_batches(batch_size=chunksize, columns=columns):
+                yield batch.to_pandas()
+        else:
+            yield from read_csv(source, usecols=columns, chunksize=chunksize)
+    elif isinstance(source, DataFrame):
+        for i in range(0, len(source), chunksize):
+            yield source.iloc[i:i + chunksize]
+    else:
+        yield from source
+
+def _parse_dates(dates, date_format=None):
+    '''Dates as datetimes. Columns that are not datetimes already are parsed in date_format; without it,
+    numbers are read as YYYYMMDD, as CRSP dates read from a CSV file, and the format of strings is inferred.'''
+    if is_datetime64_any_dtype(dates):
+        return dates
+    if is_numeric_dtype(dates):
+        dates = dates.astype('int64').astype(str)
+        date_format = date_format or '%Y%m%d'
+    return to_datetime(dates, format=date_format)
+
+class _MonthlyAggregator(ABC):
+    '''Running per-(entity, month) sums of daily values, updated one chunk of the daily panel at a time.
+
+    Each chunk is reduced to its own entity-month sums, which are kept as pending parts and merged into
+    the running sums once they outgrow them, so memory is bounded by the chunk size and the number of
+    entity-months, not by the number of daily rows.
+    '''
+    def __init__(self, entity: str, date: str, columns: list, min_days: int, date_format: str = None):
+        self.entity = entity
+        self.columns = columns
+        self.date = date
+        self.date_format = date_format
+        self.min_days = min_days
+        self._sums = None
+        self._parts = []
+        self._pending = 0
+
+    @abstractmethod
+    def _daily(self, chunk: DataFrame) -> DataFrame:
+        '''The daily values to sum, with a column 'days' of 1 for the days that count.'''
+
+    @abstractmethod
+    def _monthly(self, sums: DataFrame) -> DataFrame:
+        '''The monthly panel from the entity-month sums.'''
+
+    def _compact(self):
+        if not self._parts:
+            return
+        parts = self._parts if self._sums is None else [self._sums] + self._parts
+        self._sums = concat(parts).groupby(level=[0, 1]).sum()
+        self._parts, self._pending = [], 0
+
+    def update(self, chunk: DataFrame):
+        '''Add a chunk of daily rows.'''
+        values = self._daily(chunk)
+        month = _parse_dates(chunk[self.date], self.date_format).dt.to_period('M').array.asi8
+        part = values.groupby([chunk[self.entity].to_numpy(), month]).sum()
+        self._parts.append(part)
+        self._pending += len(part)
+        if self._pending > max(len(self._sums) if self._sums is not None else 0, 100000):
+            self._compact()
+        return self
+
+    def result(self) -> DataFrame:
+        '''The monthly panel of the chunks added so far.'''
+        self._compact()
+        if self._sums is None:
+            raise InputError('No daily rows have been added.')
+        sums = self._sums
+        if self.min_days:
+            sums = sums[sums['days'] >= self.min_days]
+        df = self._monthly(sums)
+        df.index.names = [self.entity, 'jdate']
+        df = df.reset_index()
+        df['jdate'] = PeriodIndex.from_ordinals(df['jdate'], freq='M').to_timestamp() + BMonthEnd()
+        return df.sort_values([self.entity, 'jdate'], ignore_index=True)
+
+    def fit(self, source, chunksize: int = 1000000) -> DataFrame:
+        '''Stream a daily panel through the aggregator and return the monthly panel.
+
+        Parameters
+        ----------
+        source : str, DataFrame or iterable
+            A CSV or Parquet file, a DataFrame, or an iterable of DataFrames of daily rows.
+        chunksize : int, optional
+            The number of rows read at a time. Default is 1000000.
+        '''
+        for chunk in _read_chunks(source, [self.entity, self.date] + self.columns, chunksize):
+            self.update(chunk)
+        return self.result()
+
+def _momentum(data_set, entity, date, on, windows, freq, min_periods, delist, vol):
+    # windows are (formation, skip): the returns of periods t-formation+1 ... t-skip, looked up by period
+    # rather than by row so that months missing from an entity's history are not skipped over
+    _temp_set = data_set[[entity, date, on] + ([delist] if delist else [])].dropna(subset=[entity, date])
+    _temp_set = _temp_set.sort_values([entity, date], ignore_index=True)
+    ret = _temp_set[on].to_numpy(dtype=float)
+    if delist:
+        dlret = _temp_set[delist].to_numpy(dtype=float)
+        ret = where(isnan(dlret), ret, (1 + nan_to_num(ret))*(1 + dlret) - 1)
+    period = _temp_set[date].dt.to_period(freq).array.asi8
+    codes = factorize(_temp_set[entity])[0]
+    reach = max(formation for formation, _ in windows)
+    span = (period.max() - period.min() if len(period) else 0) + 2*reach + 1
+    key = codes*span + period - (period.min() if len(period) else 0) + reach
+    if (diff(key) == 0).any():
+        raise InputError(f'There are entities with more than one {on} in a period of {freq}.')
+
+    df = _temp_set[[entity, date]]
+    sums = _log_prefix_sums(ret)
+    for formation, skip in windows:
+        lo = searchsorted(key, key - formation + 1, 'left')
+        hi = searchsorted(key, key - skip, 'right')
+        mom = _compound(sums, lo, hi)
+        needed = formation - skip if min_periods is None else min(min_periods, formation - skip)
+        mom[sums['valid'][hi] - sums['valid'][lo] < needed] = nan
+        df = df.assign(**{f'MOM[{formation},{skip}]': mom})
+    if vol:
+        # ex-ante volatility of the vol_window periods up to t, from prefix sums of returns and squares
+        vol_window, periods_per_year, target_vol = vol
+        lo = searchsorted(key, key - vol_window + 1, 'left')
+        hi = searchsorted(key, key, 'right')
+        valid = ~isnan(ret)
+        n = (sums['valid'][hi] - sums['valid'][lo])
+        s1 = _prefix_sum(where(valid, ret, 0))
+        s2 = _prefix_sum(where(valid, ret, 0)**2)
+        with errstate(invalid='ignore', divide='ignore'):
+            sd = sqrt(((s2[hi] - s2[lo]) - (s1[hi] - s1[lo])**2/n)/(n - 1)*periods_per_year)
+        sd[n < (vol_window if min_periods is None else min(min_periods, vol_window))] = nan
+        df = df.assign(VOL=sd)
+    return df
+
 
 class Lottery:
 
@@ -12,7 +251,9 @@ class Lottery:
                 entity: str, 
                 date: str, 
                 on: str, 
-                maxn: int) -> DataFrame:
+                maxn: int,
+                chunk_size: int = None,
+                n_jobs: int = 1) -> DataFrame:
         """
         A function for generating the MAX signals, which are the maximum daily returns 
         within a month.
@@ -23,7 +264,9 @@ class Lottery:
             A panel data dataframe in a frequency of daily level. Columns 
             should have names of entity, date and daily return. The index of it
             should be a range index. Note that columns of date should be in 
-            datetime index
+            datetime index. It can also be an iterable of such dataframes, e.g.,
+            a daily file read shard by shard, as long as every entity is in one 
+            of them only.
         entity : str
             Name of entity. e.g. 'permno' in CRSP dataset.
         date : str
@@ -34,37 +277,114 @@ class Lottery:
             The amount of the largest values that would be encounted into
             maxmium signals. e.g. The function would return values of 
             max1 ~ max5 based on maxn of 5.
+        chunk_size : int, optional
+            Process the entities of data_set in chunks of chunk_size entities
+            to bound the memory of the sort. Default is all at once.
+        n_jobs : int, optional
+            The number of processes working on chunks. Default is 1.
 
         Returns
         -------
         df : DataFrame
             A panel data dataframe in a monthly frequency. Column names would 
-            be entity, date, jdate, maxn_date and maxn_ret. Noted that index 
-            would be a range index rather than multi-index of entity and jdate.
+            be entity, jdate, max1_date, max1_ret, ..., maxn_date and maxn_ret. 
+            Noted that index would be a range index rather than multi-index of 
+            entity and jdate.
         """
-        try:
-            _temp_set = data_set[[entity, date, on]]\
-                .sort_values([entity, date])
-            _temp_set.loc[:, 'jdate'] = _temp_set.loc[:, date]\
-                .dt.to_period('M').dt.to_timestamp() + BMonthEnd()
-            _max_set = _temp_set.groupby([entity, 'jdate'])[[date, on]]\
-                .apply(lambda x:x.nlargest(maxn, columns=on)).reset_index()
-            del _temp_set
-            df = DataFrame()
-            for i in range(maxn):
-                _max_ = _max_set.groupby([entity, 'jdate'])[[date, on]].nth(i)\
-                .rename(columns={date:f'max{i+1}_date', on:f'max{i+1}_ret'})
-                df = concat([df, _max_], axis=1)
-                del _max_
-            return df.reset_index()
-        except Exception as e:
-            print(e)
+        if maxn < 1:
+            raise InputError('maxn should be a positive integer.')
+        chunks = _entity_chunks(data_set, entity, chunk_size)
+        df = _map_chunks(_max_ret, chunks, n_jobs, entity, date, on, maxn)
+        return df.sort_values([entity, 'jdate'], ignore_index=True)
     
-    def skewexp(self):
-        pass
+    def _residual_moments(self, data_set, entity, date, on, factors, min_obs, chunk_size, n_jobs):
+        if isinstance(factors, str):
+            factors = KenFrenchLib().get_factors(factors, 'D')
+        chunks = _entity_chunks(data_set, entity, chunk_size)
+        df = _map_chunks(_idiosyncratic, chunks, n_jobs, entity, date, on, factors, min_obs)
+        return df.sort_values([entity, 'jdate'], ignore_index=True)
 
-    def ivol(self):
-        pass
+    def ivol(self,
+             data_set: DataFrame,
+             entity: str,
+             date: str,
+             on: str,
+             factors='FF3',
+             min_obs: int = 15,
+             chunk_size: int = None,
+             n_jobs: int = 1) -> DataFrame:
+        """
+        A function for generating idiosyncratic volatility (IVOL), the standard 
+        deviation of the residuals of a regression of daily excess returns on 
+        factors within each month.
+
+        The regressions of all entity-months are solved together: their X'X and 
+        X'y are accumulated in one pass and solved as one stacked system, so no 
+        regression is run per group.
+
+        Parameters
+        ----------
+        data_set : DataFrame
+            A panel data dataframe in a frequency of daily level with columns of 
+            entity, date and daily return, or an iterable of such dataframes, as 
+            long as every entity is in one of them only.
+        entity : str
+            Name of entity. e.g. 'permno' in CRSP dataset.
+        date : str
+            Name of date. e.g. 'date' in CRSP dataset.
+        on : str
+            Name of return. e.g. 'ret' in CRSP dataset.
+        factors : str or DataFrame, optional
+            A dataset name of `KenFrenchLib.get_factors` at daily frequency, or a 
+            dataframe of daily factors indexed by date. Returns are in excess of 
+            the 'RF' column if there is one, and all other columns are regressors. 
+            Default is 'FF3'.
+        min_obs : int, optional
+            The minimum number of days in a month. Default is 15.
+        chunk_size : int, optional
+            Process the entities of data_set in chunks of chunk_size entities. 
+            Default is all at once.
+        n_jobs : int, optional
+            The number of processes working on chunks. Default is 1.
+
+        Returns
+        -------
+        df : DataFrame
+            A panel data dataframe in a monthly frequency with columns of entity, 
+            jdate, IVOL (daily, with a degrees-of-freedom correction for the 
+            regressors) and nobs.
+        """
+        df = self._residual_moments(data_set, entity, date, on, factors, min_obs, chunk_size, n_jobs)
+        return df[[entity, 'jdate', 'IVOL', 'nobs']]
+
+    def skewexp(self,
+                data_set: DataFrame,
+                entity: str,
+                date: str,
+                on: str,
+                factors='FF3',
+                min_obs: int = 15,
+                chunk_size: int = None,
+                n_jobs: int = 1) -> DataFrame:
+        """
+        A function for generating idiosyncratic skewness (ISKEW), the skewness of 
+        the residuals of a regression of daily excess returns on factors within 
+        each month, estimated as in `ivol`. ISKEW is the realized skewness that 
+        expected skewness models are fitted on.
+
+        Parameters
+        ----------
+        data_set, entity, date, on, factors, min_obs, chunk_size, n_jobs
+            As in `ivol`.
+
+        Returns
+        -------
+        df : DataFrame
+            A panel data dataframe in a monthly frequency with columns of entity, 
+            jdate, ISKEW and nobs.
+        """
+        df = self._residual_moments(data_set, entity, date, on, factors, min_obs, chunk_size, n_jobs)
+        return df[[entity, 'jdate', 'ISKEW', 'nobs']]
 
     def prc(self):
         pass
@@ -73,17 +393,216 @@ class Lottery:
         pass
 
 class Momentum:
-    def cross_sectional_mom(self):
-        pass
+    """
+    Momentum signals of a panel of returns in long format. The log gross returns of every entity are 
+    prefix-summed once, and every window is a difference of two lookups found by period, so any set of 
+    windows comes from one pass, months missing from an entity's history are not bridged over, and 
+    an entity has no signal beyond its last return. With chunk_size or an iterable of shards, daily 
+    data is processed a piece of entities at a time.
+    """
+    def cross_sectional_mom(self,
+                            data_set: DataFrame,
+                            entity: str,
+                            date: str,
+                            on: str,
+                            windows: list = [(12, 1)],
+                            freq: str = 'M',
+                            min_periods: int = None,
+                            delist: str = None,
+                            chunk_size: int = None,
+                            n_jobs: int = 1) -> DataFrame:
+        """
+        A function for generating momentum signals, which are the cumulative returns over 
+        formation windows excluding the most recent periods.
 
-    def time_series_mom(self):
-        pass
+        Parameters
+        ----------
+        data_set : DataFrame
+            A panel data dataframe with columns of entity, date and return, or an 
+            iterable of such dataframes, e.g., a daily file read shard by shard, as 
+            long as every entity is in one of them only.
+        entity : str
+            Name of entity. e.g. 'permno' in CRSP dataset.
+        date : str
+            Name of date. e.g. 'date' in CRSP dataset.
+        on : str
+            Name of return. e.g. 'ret' in CRSP dataset.
+        windows : list, optional
+            (formation, skip) pairs. The signal of (formation, skip) at period t 
+            compounds the returns of periods t-formation+1 to t-skip, e.g., (12, 1) 
+            is the 12-2 momentum of the next month, (6, 0) the 6-1 momentum and 
+            (36, 12) the 36-13 momentum. Default is [(12, 1)].
+        freq : str, optional
+            The frequency of the periods, 'M' for monthly data and 'B' for daily 
+            data in business days. Default is 'M'.
+        min_periods : int, optional
+            The minimum number of returns in a window. Default is all of them.
+        delist : str, optional
+            Name of delisting return, e.g. 'dlret', compounded with the return of 
+            the same period.
+        chunk_size : int, optional
+            Process the entities of data_set in chunks of chunk_size entities. 
+            Default is all at once.
+        n_jobs : int, optional
+            The number of processes working on chunks. Default is 1.
 
-class Illquidity:
-    pass
+        Returns
+        -------
+        df : DataFrame
+            A panel data dataframe with columns of entity, date and MOM[formation,skip] 
+            for every window, sorted by entity and date with a range index.
+        """
+        windows = [(int(formation), int(skip)) for formation, skip in windows]
+        for formation, skip in windows:
+            if not 0 <= skip < formation:
+                raise InputError(f'The window ({formation}, {skip}) should have 0 <= skip < formation.')
+        chunks = _entity_chunks(data_set, entity, chunk_size)
+        df = _map_chunks(_momentum, chunks, n_jobs, entity, date, on, windows, freq, min_periods, delist, None)
+        return df.sort_values([entity, date], ignore_index=True)
 
-class Turnover:
-    pass
+    def time_series_mom(self,
+                        data_set: DataFrame,
+                        entity: str,
+                        date: str,
+                        on: str,
+                        formation: int = 12,
+                        skip: int = 0,
+                        target_vol: float = None,
+                        vol_window: int = 36,
+                        periods_per_year: int = 12,
+                        freq: str = 'M',
+                        min_periods: int = None,
+                        delist: str = None,
+                        chunk_size: int = None,
+                        n_jobs: int = 1) -> DataFrame:
+        """
+        A function for generating time series momentum (TSMOM) signals, the sign of 
+        each entity's own past return, optionally scaled to a target volatility.
+
+        Parameters
+        ----------
+        data_set, entity, date, on, freq, min_periods, delist, chunk_size, n_jobs
+            As in `cross_sectional_mom`.
+        formation : int, optional
+            The number of periods of the past return. Default is 12.
+        skip : int, optional
+            The number of most recent periods left out. Default is 0.
+        target_vol : float, optional
+            If given, the sign is scaled by target_vol / VOL, where VOL is the 
+            annualized volatility of the vol_window periods up to t.
+        vol_window : int, optional
+            The number of periods of the volatility. Default is 36.
+        periods_per_year : int, optional
+            The number of periods in a year, for annualizing VOL. Default is 12.
+
+        Returns
+        -------
+        df : DataFrame
+            A panel data dataframe with columns of entity, date, MOM[formation,skip], 
+            TSMOM[formation,skip] and, with a target_vol, VOL.
+        """
+        if not 0 <= skip < formation:
+            raise InputError(f'The window ({formation}, {skip}) should have 0 <= skip < formation.')
+        vol = (vol_window, periods_per_year, target_vol) if target_vol else None
+        chunks = _entity_chunks(data_set, entity, chunk_size)
+        df = _map_chunks(_momentum, chunks, n_jobs, entity, date, on, [(formation, skip)], freq, min_periods,
+                         delist, vol)
+        signal = sign(df[f'MOM[{formation},{skip}]'])
+        if target_vol:
+            signal = signal*target_vol/df['VOL']
+        df[f'TSMOM[{formation},{skip}]'] = signal
+        return df.sort_values([entity, date], ignore_index=True)
+
+class Illquidity(_MonthlyAggregator):
+    """
+    Amihud (2002) illiquidity, the monthly average of daily |ret| / (|prc| * vol), 
+    aggregated from a daily panel streamed in chunks.
+
+    Parameters
+    ----------
+    entity : str, optional
+        Name of entity. Default is 'permno' as in CRSP dataset.
+    date : str, optional
+        Name of date. Default is 'date'.
+    ret : str, optional
+        Name of daily return. Default is 'ret'.
+    prc : str, optional
+        Name of price; negative CRSP prices (bid-ask averages) count by their 
+        absolute values. Default is 'prc'.
+    vol : str, optional
+        Name of trading volume. Default is 'vol'.
+    min_days : int, optional
+        The minimum number of days with a return and a positive dollar volume 
+        in a month. Default is 15.
+    scale : float, optional
+        Multiplier of the average, e.g. 1e6 for illiquidity per million dollars. 
+        Default is 1e6.
+    date_format : str, optional
+        The format of dates that are not datetimes already. Default is None, 
+        reading integers as YYYYMMDD (CRSP dates in a CSV file) and inferring 
+        the format of strings.
+
+    Examples
+    --------
+    >>> Illquidity(min_days=15).fit('dsf.parquet', chunksize=5000000)
+    """
+    def __init__(self, entity: str = 'permno', date: str = 'date', ret: str = 'ret', prc: str = 'prc',
+                 vol: str = 'vol', min_days: int = 15, scale: float = 1e6, date_format: str = None):
+        super().__init__(entity, date, [ret, prc, vol], min_days, date_format)
+        self.ret, self.prc, self.vol = ret, prc, vol
+        self.scale = scale
+
+    def _daily(self, chunk):
+        ret = chunk[self.ret].to_numpy(dtype=float)
+        dollar_vol = abs(chunk[self.prc].to_numpy(dtype=float))*chunk[self.vol].to_numpy(dtype=float)
+        days = ~isnan(ret) & (dollar_vol > 0)
+        with errstate(divide='ignore', invalid='ignore'):
+            illiq = where(days, abs(ret)/dollar_vol, 0)
+        return DataFrame({'illiq': illiq, 'days': days.astype(int)})
+
+    def _monthly(self, sums):
+        return DataFrame({'ILLIQ': sums['illiq']/sums['days']*self.scale, 'ndays': sums['days']})
+
+class Turnover(_MonthlyAggregator):
+    """
+    Share turnover, the monthly sum of daily vol / shrout, aggregated from a daily 
+    panel streamed in chunks.
+
+    Parameters
+    ----------
+    entity : str, optional
+        Name of entity. Default is 'permno' as in CRSP dataset.
+    date : str, optional
+        Name of date. Default is 'date'.
+    vol : str, optional
+        Name of trading volume. Default is 'vol'.
+    shrout : str, optional
+        Name of shares outstanding. Default is 'shrout'.
+    min_days : int, optional
+        The minimum number of days with a volume and positive shares outstanding 
+        in a month. Default is 15.
+    scale : float, optional
+        Multiplier of the sum, e.g. 1e-3 for CRSP, where vol is in shares and 
+        shrout in thousands of shares. Default is 1.
+    date_format : str, optional
+        As in `Illquidity`.
+    """
+    def __init__(self, entity: str = 'permno', date: str = 'date', vol: str = 'vol', shrout: str = 'shrout',
+                 min_days: int = 15, scale: float = 1., date_format: str = None):
+        super().__init__(entity, date, [vol, shrout], min_days, date_format)
+        self.vol, self.shrout = vol, shrout
+        self.scale = scale
+
+    def _daily(self, chunk):
+        vol = chunk[self.vol].to_numpy(dtype=float)
+        shrout = chunk[self.shrout].to_numpy(dtype=float)
+        days = ~isnan(vol) & (shrout > 0)
+        with errstate(divide='ignore', invalid='ignore'):
+            turn = where(days, vol/shrout, 0)
+        return DataFrame({'turn': turn, 'days': days.astype(int)})
+
+    def _monthly(self, sums):
+        return DataFrame({'TURN': sums['turn']*self.scale, 'ndays': sums['days']})
 
 class BookToMarketRatio:
     pass
@@ -2,65 +2,238 @@
 
 import io
 import os
-import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Lock
 from zipfile import ZipFile
 
 import requests
+from requests.adapters import HTTPAdapter
+from numpy import array
 from _io import StringIO
 from bs4 import BeautifulSoup as bs
-from pandas import DataFrame, read_csv, read_excel, to_datetime
+from pandas import DataFrame, concat, read_csv, read_excel, read_parquet, to_datetime
 from pandas.tseries.offsets import BMonthEnd, BYearEnd
 
 from QuantFin.HandleError import InputError
 
 
+class _LRUCache:
+    """A small thread-safe LRU cache of parsed datasets."""
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_MISSING = [-99.99, -999]
+_NOT_PERCENT = ['number of firms', 'firm size', 'sum of', 'average of']
+
+
+def _parse_french_csv(lines, long_freq='daily') -> dict:
+    """Parse every table of a Ken French CSV file in one pass over its lines.
+
+    Tables start with a header line beginning with ',' and run over the lines led by a date, with 4
+    (annual), 6 (monthly) or 8 (`long_freq`) digits. The title of a table is the text line right above
+    its header, if any. Returns a dict of {(freq, title): DataFrame} in the order of the file, with a
+    DatetimeIndex named 'date'. Returns in percent are converted to decimals and missing values
+    (-99.99, -999) to NaN.
+    """
+    sections = {}
+    previous, title, columns, keys, rows = '', None, None, [], []
+
+    def _close():
+        if columns is None or not rows:
+            return
+        data = DataFrame(array(rows, dtype=float), columns=columns)
+        data = data.mask(data.isin(_MISSING))
+        if not any(w in title.lower() for w in _NOT_PERCENT):
+            data = data/100
+        width = len(keys[0])
+        if width == 4:
+            freq, index = 'annual', to_datetime(keys, format='%Y') + BYearEnd()
+        elif width == 6:
+            freq, index = 'monthly', to_datetime(keys, format='%Y%m') + BMonthEnd()
+        else:
+            freq, index = long_freq, to_datetime(keys, format='%Y%m%d')
+        data.index = index.rename('date')
+        sections[(freq, title or freq)] = data
+
+    for line in lines:
+        line = line.rstrip('\r\n')
+        cells = line.split(',')
+        key = cells[0].strip()
+        if columns is not None and key.isdigit() and len(key) in [4, 6, 8] and len(cells) == len(columns)+1:
+            keys.append(key)
+            rows.append(cells[1:])
+            continue
+        _close()
+        columns, keys, rows = None, [], []
+        if line.lstrip().startswith(','):
+            title, columns = previous.strip(), cells[1:]
+        previous = line
+    _close()
+    return sections
+
+
+_SESSION = None
+_SESSION_LOCK = Lock()
+
+
+def _get_session(pool_size=16):
+    """One pooled HTTP session shared by all downloads."""
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            _SESSION = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            _SESSION.mount('http://', adapter)
+            _SESSION.mount('https://', adapter)
+    return _SESSION
+
+
 class Req:
     def __init__(self, fpath='./dataLib/'):
         self.fpath = fpath
         if not os.path.exists(fpath):
-            os.mkdir(fpath)
+            os.makedirs(fpath, exist_ok=True)
+        self.session = _get_session()
     
     def _download_file(self, url, name=''):
         print(f'Downloading file {name}')
-        res = requests.get(url, stream=True)
+        res = self.session.get(url, stream=True)
+        res.raise_for_status()
         return res
 
     def _download_zipfile(self, url):
         res = self._download_file(url)
-        z = ZipFile(io.BytesIO(res.content))
+        buffer = io.BytesIO()
+        for chunk in res.iter_content(chunk_size=1 << 16):
+            buffer.write(chunk)
+        z = ZipFile(buffer)
         return z
     
     def _download_store_unzip_file(self, url):
         z = self._download_zipfile(url)
         z.extractall(self.fpath)
         print('File unzipped and stored in ./dataLib ')
+
+    def _download_store_file(self, url, name):
+        """Stream a file to fpath, replacing the stored file only once the download is complete."""
+        res = self._download_file(url, name)
+        with open(self.fpath+name+'.part', 'wb') as f:
+            for chunk in res.iter_content(chunk_size=1 << 16):
+                f.write(chunk)
+        os.replace(self.fpath+name+'.part', self.fpath+name)
+        return self.fpath+name
     
     def _download_store_excel(self, url, name):
-        res = self._download_file(url, name)
-        with open(self.fpath+name, 'wb') as f:
-            f.write(res.content)
-        return res
+        return self._download_store_file(url, name)
     
     def _download_store_csv(self, url, name):
-        res = self._download_file(url, name)
-        res = requests.get(url)
-        df = read_csv(StringIO(res.content.decode()))
-        df.to_csv(self.fpath+name)
-        return df
+        return read_csv(self._download_store_file(url, name))
     
     def _download_store_txt(self, url, filename):
-        string = self._download_file(url, filename).text
-        with open(self.fpath+filename, 'w', encoding="utf-8") as f:
-            f.write(string)
-        return string
+        with open(self._download_store_file(url, filename), 'r', encoding="utf-8", newline='') as f:
+            return f.read()
+
+    def _prefetch(self, func, keys, max_workers):
+        """Run func on every key in a bounded thread pool. Returns the keys that succeeded."""
+        done = []
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(func, key): key for key in keys}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    done.append(futures[future])
+                except Exception as e: # pylint: disable=broad-except
+                    print(f'Exception Error: {futures[future]}: {e}')
+        return [key for key in keys if key in done]
     
 
 class KenFrenchLib(Req):
     """This a class for downloading factor data from Ken.French (http://mba.tuck.dartmouth.edu/pages/faculty/ken.french/data_library.html)
+
+    Parsed datasets are cached in memory (shared by all instances) and stored as Parquet files under
+    `fpath`, so repeated requests do not download or parse the files again. Stored files older than
+    `cache_days` are downloaded again.
     """
-    def __init__(self):
-        super().__init__()
-        self.domain = 'https://mba.tuck.dartmouth.edu/pages/faculty/ken.french/ftp/'
+    _cache = _LRUCache()
+
+    def __init__(self, fpath='./dataLib/', cache_days: float = 7,
+                 domain='https://mba.tuck.dartmouth.edu/pages/faculty/ken.french/ftp/'):
+        super().__init__(fpath)
+        self.domain = domain
+        self.cache_days = cache_days
+
+    @classmethod
+    def clear_cache(cls):
+        """Clear the in-memory cache of parsed datasets."""
+        cls._cache.clear()
+
+    def _cache_file(self, file):
+        return f'{self.fpath}{file}_sections.parquet'
+
+    def _read_cache(self, file):
+        sections = self._cache.get(file)
+        if sections is not None:
+            return sections
+        f = self._cache_file(file)
+        if os.path.exists(f) and time.time() - os.path.getmtime(f) < self.cache_days*86400:
+            try:
+                data = read_parquet(f)
+            except ImportError:
+                return None
+            # sections are stacked in one frame with the union of their columns, so the columns of each
+            # are stored with it; a file written without them is read as stale
+            if 'columns' not in data.attrs:
+                return None
+            groups = dict(iter(data.groupby(level=['freq', 'table'], sort=False)))
+            sections = {
+                (freq, table): groups[freq, table].droplevel(['freq', 'table']).reindex(columns=columns)
+                for freq, table, columns in data.attrs['columns']
+            }
+            self._cache.put(file, sections)
+        return sections
+
+    def _write_cache(self, file, sections):
+        self._cache.put(file, sections)
+        data = concat(sections, names=['freq', 'table'])
+        data.attrs['columns'] = [[freq, table, list(_d.columns)] for (freq, table), _d in sections.items()]
+        try:
+            data.to_parquet(self._cache_file(file))
+        except ImportError:
+            print('Parquet support (pyarrow or fastparquet) is not installed, data is only cached in memory')
+
+    def _get_sections(self, file, refresh=False):
+        """Get all parsed sections of a data file, downloading it only if it is not cached."""
+        sections = None if refresh else self._read_cache(file)
+        if sections is None:
+            z = self._download_zipfile(self.domain + file + '_CSV.zip')
+            with z.open(z.namelist()[0]) as f:
+                sections = _parse_french_csv(
+                    io.TextIOWrapper(f, encoding='latin-1'), 'weekly' if file.endswith('_weekly') else 'daily')
+            self._write_cache(file, sections)
+        return sections
 
     def show_all(self) -> list:
         """This is a function for showing all avaiable factor sets.
@@ -69,7 +242,7 @@ class KenFrenchLib(Req):
             list: this is a list of names for all factor sets listed on Ken.French data library. 
         """
         home = 'http://mba.tuck.dartmouth.edu/pages/faculty/ken.french/data_library.html'
-        res = requests.get(home)
+        res = self.session.get(home)
         soup = bs(res.content, 'html.parser')
         links = soup.find_all(href=True)
         ls = ''
@@ -155,7 +328,52 @@ class KenFrenchLib(Req):
             sic_dict = None
         return sic_dict
     
-    def get_factors(self, factors: str, freq: str) -> DataFrame:
+    @staticmethod
+    def _file_name(factors, freq):
+        """The frequency name and the data file name (without '_CSV.zip') of a dataset."""
+        freq = freq.lower()
+
+        if freq in ['y', 'yearly', 'year', 'annual', 'a']:
+            _freq = 'annual'
+        elif freq in ['month', 'm', 'monthly']:
+            _freq = 'monthly'
+        elif freq in ['daily', 'd', 'day']:
+            _freq = 'daily'
+        elif freq in ['weekly', 'w', 'week']:
+            _freq = 'weekly'
+        else:
+            raise InputError(
+                "Incorrect frequency level. Options are 'ANNUAL', 'WEEKLY', 'DAILY', 'MONTHLY'"
+            )
+
+        dataset = {
+            'ff3': 'F-F_Research_Data_Factors',
+            'ff5': 'F-F_Research_Data_5_Factors_2x3',
+            'mom': 'F-F_Momentum_Factor',
+        }.get(factors.lower(), factors)
+        return _freq, dataset if _freq in ['annual', 'monthly'] else dataset + '_' + _freq
+
+    def prefetch(self, names: list, freqs: list = ['M'], max_workers: int = 8, refresh: bool = False) -> list:
+        """Download, parse and cache many datasets concurrently, e.g. to warm the cache of a new machine.
+
+        Args:
+            names (list): Dataset names as in get_factors, e.g. ['FF3', 'FF5', 'MOM', '6_Portfolios_2x3'].
+            freqs (list, optional): Frequencies to fetch for every dataset. Monthly and annual tables are in the same file. Defaults to ['M'].
+            max_workers (int, optional): The maximum number of concurrent downloads. Defaults to 8.
+            refresh (bool, optional): Download files again even if they are cached. Defaults to False.
+
+        Returns:
+            list: The names of the data files fetched successfully.
+        """
+        files = []
+        for name in names:
+            for freq in freqs:
+                file = self._file_name(name, freq)[1]
+                if file not in files:
+                    files.append(file)
+        return self._prefetch(lambda file: self._get_sections(file, refresh), files, max_workers)
+
+    def get_factors(self, factors: str, freq: str, refresh: bool = False, table: str = None) -> DataFrame:
         """This is a fucntion for getting a factor data from Ken.French Lib. 
 
         Args:
@@ -166,84 +384,43 @@ class KenFrenchLib(Req):
                 other dataset names can be found by using function of "show_all()".
 
             freq (str): Indicate the frequency of data, e.g., 'D' for daily, 'M' for monthly, 'W' for weekly, 'Y' or 'A' for annual, default is 'M'.
+            refresh (bool, optional): Download the data again even if it is cached. Defaults to False.
+            table (str, optional): A part of the title of the table to get from files with several tables
+                of the same frequency, e.g., 'Equal Weighted' in portfolio files. Defaults to the first table.
 
         Returns:
             DataFrame: A dataframe of factors data with column labels of factor names and an index of datetime in business day format.
         """
 
-        freq = freq.lower()
-        factors = factors.lower()
+        _freq, file = self._file_name(factors, freq)
 
-        if freq in ['y', 'yearly', 'year', 'annual', 'a']:
-            _freq = 'annual'
-        elif freq in ['month', 'm', 'monthly']:
-            _freq = 'monthly'
-        elif freq in ['daily', 'd', 'day']:
-            _freq = 'daily'
-        elif freq in ['weekly', 'w', 'week']:
-            _freq = 'weekly'
-        else:
-            raise InputError(
-                "Incorrect frequency level. Options are 'ANNUAL', 'WEEKLY', 'DAILY', 'MONTHLY'"
-            )
+        sections = self._get_sections(file, refresh)
+        for (_f, _t), data in sections.items():
+            if _f == _freq and (table is None or table.lower() in _t.lower()):
+                return data.copy()
+        raise InputError(
+            f"Found no {_freq} table{'' if table is None else ' of ' + table} in {file}. Available tables are {list(sections)}."
+        )
 
-        if factors == 'ff3':
-            factors = 'F-F_Research_Data_Factors'
-        elif factors == 'ff5':
-            factors = 'F-F_Research_Data_5_Factors_2x3'
-        elif factors == 'mom':
-            factors = 'F-F_Momentum_Factor'
-        else:
-            raise InputError(
-                "Incorrect factor name. Options are 'MOM', 'FF3', 'FF5' or other specific dataset names listed on site."
-            )
-        
-        if _freq in ['annual', 'monthly']:
-            url = self.domain + factors + '_CSV.zip'
-        else:
-            url = self.domain + factors + '_' + _freq + '_CSV.zip'
-
-        res = requests.get(url).content
-        if url[-4:] == '.csv':
-            string = res.decode()
-        elif url[-4:] == '.zip':
-            with tempfile.TemporaryFile() as tmpf:
-                tmpf.write(res)
-                with ZipFile(tmpf, "r") as zf:
-                    string = zf.open(zf.namelist()[0]).read().decode()
-
-        ls = string.split('\r\n\r\n')
-        ds = {}
-        for l in ls:
-            if len(l) >= 1000:
-                if l[0] == ',':
-                    ds.update({0: read_csv(StringIO('date'+l))})
-                if 'annual' in l.lower() or 'year' in l.lower():
-                    for i, s in enumerate(l):
-                        if s == ',':
-                            l = l[i:]
-                            ds.update({1: read_csv(StringIO('date'+l))})
-                            break
-                            
-        if _freq == 'annual':
-            data = ds[1]
-        else:
-            data = ds[0]
-        data.set_index('date', inplace=True)
-        if _freq == 'monthly':
-            data.index = to_datetime(data.index, format='%Y%m') + BMonthEnd()
-        elif _freq == 'annual':
-            data.index = to_datetime(data.index, format='%Y') + BYearEnd()
-        else:
-            data.index = to_datetime(data.index, format='%Y%m%d')
-        return data/100
 
 class ZhiDaLib(Req):
     """This is a class for downloading data from Zhi Da's personal website.
     """
-    def __init__(self):
-        super().__init__()
-        self.domain = 'https://www3.nd.edu/~zda/'
+    def __init__(self, fpath='./dataLib/', domain='https://www3.nd.edu/~zda/'):
+        super().__init__(fpath)
+        self.domain = domain
+
+    def prefetch(self, names: list = ['PEAR.xlsx', 'fears_post_20140512.csv', 'nat.txt'], max_workers: int = 8) -> list:
+        """Download and store many files concurrently.
+
+        Args:
+            names (list, optional): File names on the website. Defaults to the PEAR, FEARS and NAT files.
+            max_workers (int, optional): The maximum number of concurrent downloads. Defaults to 8.
+
+        Returns:
+            list: The names of the files fetched successfully.
+        """
+        return self._prefetch(lambda name: self._download_store_file(self.domain+name, name), names, max_workers)
 
     def get_pear_index(self, update: bool=False, filename: str='PEAR.xlsx') -> DataFrame:
         """This is a function for getting PEAR index data. Please see the reference for details. Chen, Z., Da, Z., Huang, D. and Wang, L. (2023). Presidential economic approval rating and the cross-section of stock returns. Journal of Financial Economics, 147(1), pp.106-131.
@@ -255,13 +432,9 @@ class ZhiDaLib(Req):
             DataFrame: This is a dataframe of pear index data with column label of 'PEAR' and a monthly datetime index in the business day format.
         """
         
-        if update:
+        if update or not os.path.exists(self.fpath+filename):
             self._download_store_excel(self.domain+filename, filename)
-        if os.path.exists(self.fpath+filename):
-            df = read_excel(self.fpath+filename, sheet_name='DATA')
-        else:
-            res = self._download_store_excel(self.domain+filename, filename)
-            df = read_excel(res.content, sheet_name='DATA')
+        df = read_excel(self.fpath+filename, sheet_name='DATA')
         df = df.set_index('yearmonth')
         df.index = to_datetime(df.index, format='%Y%m').rename('date') + BMonthEnd()
         return df
@@ -284,16 +457,21 @@ class ZhiDaLib(Req):
         df.index = to_datetime(df.index, format='%m/%d/%Y')
         return df
 
-    def get_nat_data(self, filename='nat.txt') -> DataFrame:
+    def get_nat_data(self, filename='nat.txt', update: bool=False) -> DataFrame:
         """This is a function for getting NAT data. Please see the reference for details. Chen, Y., Da, Z., & Huang, D. (2019). Arbitrage trading: The long and the short of it. The Review of Financial Studies, 32(4), 1608-1646.
 
         Args:
             filename (str, optional): Indicate the filename. Defaults to 'nat.txt'.
+            update (bool, optional): Indicate if update the stored file. Defaults to False.
 
         Returns:
             DataFrame: This is a dataframe of pear index data with column label of 'NAT' and a datetime index
         """
-        string = self._download_store_txt(self.domain+filename, filename)
+        if update or not os.path.exists(self.fpath+filename):
+            string = self._download_store_txt(self.domain+filename, filename)
+        else:
+            with open(self.fpath+filename, 'r', encoding="utf-8", newline='') as f:
+                string = f.read()
         string = string.split('\r\n\r\n')[4].replace('\t\t','\t')
         df = read_csv(StringIO(string), sep='\t')
         df.columns = df.columns.str.lower()
@@ -1,9 +1,9 @@
 
-from QuantFin._deciles import univariate_sorting
+from QuantFin._deciles import univariate_sorting, multivariate_sorting
 from QuantFin.Portfolio import Performance, cal_portfolio_returns
 from QuantFin.PanelRegs import multiregs
 from QuantFin.ReqData import KenFrenchLib
-from QuantFin.tool import winsorize, geometric_ret
+from QuantFin.tool import winsorize, geometric_ret, GeometricReturn, CumulativeReturn
 from QuantFin._regression import ols_regs
 
 __version__ = "0.0.10"
@@ -1,44 +1,320 @@
 # -*- coding: utf-8 -*-
-from pandas import DataFrame, DatetimeIndex, concat, qcut
+from numpy import (arange, argsort, asarray, bincount, cumsum, empty, floor,
+                   flatnonzero, full, inf, int8, int16, isnan, isposinf, linspace,
+                   maximum, min_scalar_type, minimum, nan, nextafter, ones,
+                   r_, repeat, searchsorted, sort, take_along_axis, where, zeros)
+from pandas import DataFrame, Index, Series, factorize
+from pandas.arrays import IntegerArray
 from QuantFin.HandleError import InputError
-from numpy import nan
 
 
-def _cal_breakpoints(peak: float or int, bottom: float or int, decile: int) -> list:
-    return [x/100*(peak-bottom)-bottom for x in range(int(100/decile), 100, int(100/decile))]
+_RANKING_METHODS = ['average', 'min', 'max', 'first', 'dense']
 
 
-def _assign_port_num(_x, decile, edges):
-    if _x < edges[0]:
-        return 1
-    elif _x >= edges[-1]:
-        return decile
+def _cal_breakpoints(peak, bottom, decile: int):
+    '''Breakpoints of the 'ranking'/'value' methods. `peak` and `bottom` can be scalars or arrays of
+    per-period extremes, in which case a (periods x breakpoints) array is returned.'''
+    steps = arange(int(100/decile), 100, int(100/decile))
+    return steps/100*(peak-bottom)[:, None] - bottom[:, None]
+
+
+def _pad_periods(periods, values):
+    '''Lay the values of every period out as a row of a matrix padded with +inf, in their input order.
+    Returns the matrix, the flat position of every value in it and the number of values of every period,
+    or None if the periods are too uneven for the padding to pay. `periods` are codes 0..G-1.'''
+    n = len(values)
+    counts = bincount(periods)
+    n_periods, width = len(counts), counts.max(initial=0)
+    if n_periods*width > 2*n + 1024:
+        return None
+    # row start in the matrix minus row start in the panel grouped by period
+    offset = arange(n_periods)*width - (cumsum(counts) - counts)
+    key = periods.astype(min_scalar_type(n_periods))
+    if (key[1:] >= key[:-1]).all():
+        pos = arange(n) + offset[periods]
     else:
-        for i, edge in enumerate(edges):
-            if i > 0:
-                if edges[i-1] <= _x < edge:
-                    return i+1
+        by_period = argsort(key, kind='stable')
+        pos = empty(n, dtype=int)
+        pos[by_period] = arange(n) + repeat(offset, counts)
+    matrix = full((n_periods, width), inf)
+    matrix.ravel()[pos] = values
+    return matrix, pos, counts
+
+
+def _sort_within_periods(periods, values, stable=False, padded=None):
+    '''Sort the panel by (period, value). Returns the sort order, the sorted period codes and values,
+    and the start/end positions of every period in the sorted arrays. Ties keep their input order only
+    if `stable` is set, which is what ranking by 'first' needs.
+
+    The rows of the padded matrix of `_pad_periods` are sorted one by one, which costs n*log(values per
+    period) rather than the n*log(n) of sorting the whole panel; panels too uneven to pad are sorted by
+    value and then by period.'''
+    padded = padded or _pad_periods(periods, values)
+    if padded is None:
+        order = argsort(values, kind='stable' if stable else 'quicksort')
+        key = periods.astype(min_scalar_type(periods.max(initial=0)))
+        order = order[argsort(key[order], kind='stable')]
+        g = periods[order]
+        starts = r_[0, flatnonzero(g[1:] != g[:-1]) + 1]
+        ends = r_[starts[1:], len(g)]
+        return order, g, values[order], starts, ends
+    matrix, pos, counts = padded
+    # the padding only sorts after the values if ties with +inf keep their order
+    kind = 'stable' if stable or isposinf(values).any() else 'quicksort'
+    index = empty(matrix.shape, dtype=int)
+    index.ravel()[pos] = arange(len(values))
+    order = take_along_axis(index, argsort(matrix, axis=1, kind=kind), axis=1)[_filled(counts, matrix)]
+    ends = cumsum(counts)
+    return order, repeat(arange(len(counts)), counts), values[order], ends - counts, ends
+
+
+def _sorted_values(periods, values, padded=None):
+    '''As `_sort_within_periods`, without the sort order, which sorting the padded rows does not need.'''
+    padded = padded or _pad_periods(periods, values)
+    if padded is None:
+        return _sort_within_periods(periods, values, padded=padded)[1:]
+    matrix, pos, counts = padded
+    ends = cumsum(counts)
+    return (repeat(arange(len(counts)), counts), sort(matrix, axis=1)[_filled(counts, matrix)],
+            ends - counts, ends)
+
+
+def _filled(counts, matrix):
+    return arange(matrix.shape[1]) < counts[:, None]
+
+
+def _lexkeys(g, s):
+    '''Pack (period code, value) into complex numbers, which numpy orders lexicographically.'''
+    keys = empty(len(s), dtype=complex)
+    keys.real = g
+    keys.imag = s
+    return keys
+
+
+def _count_edges_below(g, s, edges, side):
+    '''For every row of the sorted panel, count the breakpoints of its own period that lie below the
+    value ('right': edges < value, 'left': edges <= value), with a single `searchsorted` call.'''
+    n_periods, n_edges = edges.shape
+    if n_edges == 0:
+        return zeros(len(s), dtype=int)
+    pos = searchsorted(
+        _lexkeys(g, s), _lexkeys(arange(n_periods).repeat(n_edges), edges.ravel()), side=side)
+    crossed = bincount(pos, minlength=len(s)+1)[:len(s)].cumsum()
+    return crossed - n_edges*g
+
+
+def _grouped_quantiles(s, starts, ends, probs):
+    '''Linear-interpolated quantiles of each period, computed as np.quantile does.'''
+    vi = (ends - starts - 1)[:, None] * probs[None, :]
+    lo = floor(vi)
+    t = vi - lo
+    lo = starts[:, None] + lo.astype(int)
+    hi = minimum(lo + 1, ends[:, None] - 1)
+    a, b = s[lo], s[hi]
+    diff = b - a
+    return where(t >= 0.5, b - diff*(1 - t), a + diff*t)
+
+
+def _grouped_ranks(g, s, starts, method):
+    '''Within-period ranks of the sorted panel, matching Series.rank(method=method).'''
+    n = len(s)
+    idx = arange(n)
+    counts = r_[starts[1:], n] - starts
+    if method == 'first':
+        return (idx - repeat(starts - 1, counts)).astype(float)
+    new = ones(n, dtype=bool)
+    new[1:] = s[1:] != s[:-1]
+    new[starts] = True
+    if method == 'dense':
+        tie = new.cumsum()
+        return (tie - repeat(tie[starts] - 1, counts)).astype(float)
+    start = repeat(starts, counts)
+    tie_start = maximum.accumulate(where(new, idx, 0))
+    tie_end = r_[flatnonzero(new)[1:], n][new.cumsum() - 1]
+    if method == 'min':
+        return (tie_start - start + 1).astype(float)
+    if method == 'max':
+        return (tie_end - start).astype(float)
+    return (tie_start + tie_end - 2*start + 1) / 2
+
+
+def _qcut_edges(s, starts, ends, decile):
+    '''Per-period qcut bin edges (including the minimum and the maximum) as a (periods x decile+1) array.'''
+    return _grouped_quantiles(s, starts, ends, linspace(0, 1, decile+1))
+
+
+def _qcut_labels(g, s, edges):
+    return _count_edges_below(g, s, edges[:, 1:-1], 'right') + 1
+
 
-def _periodic_sorting(panel_data, decile, ranking, ranking_method):
+def _ranking_labels(g, s, starts, ends, decile, ranking, ranking_method):
     if ranking:
-        panel_data = panel_data.rank(method=ranking_method)
-    peak = panel_data.max()
-    bottom = panel_data.min()
-    edges = _cal_breakpoints(peak, bottom, decile)
-    edges.sort()
-    panel_data = panel_data.apply(lambda x: _assign_port_num(x, decile, edges))
-    return panel_data
+        s = _grouped_ranks(g, s, starts, ranking_method)
+    edges = sort(_cal_breakpoints(s[ends-1], s[starts], decile), axis=1)
+    n_edges = edges.shape[1]
+    crossed = _count_edges_below(g, s, edges, 'left')
+    return where(crossed == n_edges, decile, crossed + 1)
 
 
-def _smart_periodic_sorting(panel_data, decile, ranking=True, ranking_method='dense'):
-    try:
-        panel_data = qcut(panel_data, q=decile, labels=range(1, decile+1))
-    except: # pylint: disable=bare-except
-        panel_data = _periodic_sorting(panel_data, decile, ranking, ranking_method)
-    return panel_data
+def _check_method(method, ranking_method):
+    if method not in ['qcut', 'ranking', 'value', 'smart']:
+        raise InputError(
+            "The arg of method should be 'smart', 'qcut', 'ranking' or 'value', \
+                see documentation for details."
+        )
+    if method == 'ranking' and ranking_method not in _RANKING_METHODS:
+        raise InputError(
+            f"The arg of ranking_method should be one of {_RANKING_METHODS}."
+        )
+
+
+def _check_value_cutoffs(method, ranking_method):
+    '''Breakpoint tables and subset breakpoints assign portfolios by value cutoffs, which cannot split
+    tied values the way ranking by 'first' does.'''
+    if method == 'ranking' and ranking_method == 'first':
+        raise InputError(
+            "ranking_method='first' cannot be used with breakpoint_filter or breakpoints, as ties "
+            "cannot be split by value breakpoints. Use another ranking_method."
+        )
+
+
+def _qcut_duplicated(edges, decile):
+    '''Periods whose qcut edges are not unique, i.e. where qcut would raise.'''
+    if decile > 1:
+        return (edges[:, 1:] == edges[:, :-1]).any(axis=1)
+    return zeros(len(edges), dtype=bool)
+
+
+def _sort_labels(periods, values, decile, method, ranking_method='dense'):
+    '''Vectorized portfolio assignment for all periods at once.
+
+    Computes every period's breakpoints as arrays from the panel sorted by (period, value). Labels are
+    identical to applying `qcut` or the ranking breakpoints period by period. `periods` are integer
+    codes 0..G-1 (e.g. from `factorize`) of the groups to sort within. Returns labels in the input order.
+
+    Unless ranking by 'first' splits ties, a value's portfolio only depends on its period's breakpoints
+    in the unit of the variable. Up to 32 portfolios, these are compared with the padded rows of
+    `_pad_periods` directly, one pass per breakpoint, so that the order of the sort is never needed.
+    Otherwise labels are assigned in sorted order with `searchsorted` and scattered back.
+    '''
+    _check_method(method, ranking_method)
+    first = method == 'ranking' and ranking_method == 'first'
+    padded = None if first or decile > 32 else _pad_periods(periods, values)
+    if padded is not None:
+        matrix, pos, counts = padded
+        edges = _value_breakpoints(periods, values, decile, method, ranking_method, padded)
+        labels = ones(matrix.shape, dtype=int8)
+        for k in range(edges.shape[1]):
+            labels += matrix >= edges[:, k, None]
+        return labels.ravel()[pos]
+    order, g, s, starts, ends = _sort_within_periods(periods, values, stable=first)
+    if method == 'ranking':
+        labels = _ranking_labels(g, s, starts, ends, decile, True, ranking_method)
+    elif method == 'value':
+        labels = _ranking_labels(g, s, starts, ends, decile, False, ranking_method)
+    else:
+        edges = _qcut_edges(s, starts, ends, decile)
+        duplicated = _qcut_duplicated(edges, decile)
+        if method == 'qcut' and duplicated.any():
+            raise ValueError(
+                "Bin edges must be unique in every period for method='qcut', try method='smart' instead."
+            )
+        labels = _qcut_labels(g, s, edges)
+        if duplicated.any():
+            # periods qcut cannot split fall back to dense-ranking breakpoints
+            fallback = _ranking_labels(g, s, starts, ends, decile, True, 'dense')
+            labels = where(duplicated[g], fallback, labels)
+    out = empty(len(labels), dtype=int)
+    out[order] = labels
+    return out
+
 
+def _ranking_value_edges(g, s, starts, ends, decile, ranking, ranking_method):
+    '''Breakpoints of the 'ranking'/'value' methods expressed in the unit of the sorted variable.
+    Rank breakpoints are mapped to the first value whose rank reaches them.'''
+    r = _grouped_ranks(g, s, starts, ranking_method) if ranking else s
+    edges = sort(_cal_breakpoints(r[ends-1], r[starts], decile), axis=1)[:, :decile-1]
+    if ranking and edges.size:
+        n_periods, n_edges = edges.shape
+        pos = searchsorted(
+            _lexkeys(g, r), _lexkeys(arange(n_periods).repeat(n_edges), edges.ravel()), side='left'
+        ).reshape(edges.shape)
+        edges = where(pos < ends[:, None], s[minimum(pos, len(s)-1)], inf)
+    return edges
 
-def univariate_sorting(panel_data: DataFrame, sort_on: str, decile: int = 10, port_label: str = 'port', time_label: str = 'jdate', entity_label: str = 'permno', method: str = 'ranking', ranking_method='dense') -> DataFrame:
+
+def _value_breakpoints(periods, values, decile, method, ranking_method='dense', padded=None):
+    '''Per-period breakpoints as a (periods x decile-1) array in the unit of the sorted variable. A value
+    falls into portfolio k+1 if edges[k-1] <= value < edges[k]. The qcut edges, which are closed on the
+    right, are shifted to the next float so that all methods share the same convention.'''
+    _check_method(method, ranking_method)
+    g, s, starts, ends = _sorted_values(periods, values, padded)
+    if method in ['ranking', 'value']:
+        return _ranking_value_edges(g, s, starts, ends, decile, method == 'ranking', ranking_method)
+    edges = _qcut_edges(s, starts, ends, decile)
+    duplicated = _qcut_duplicated(edges, decile)
+    if method == 'qcut' and duplicated.any():
+        raise ValueError(
+            "Bin edges must be unique in every period for method='qcut', try method='smart' instead."
+        )
+    edges = nextafter(edges[:, 1:-1], inf)
+    if duplicated.any():
+        fallback = _ranking_value_edges(g, s, starts, ends, decile, True, 'dense')
+        edges[duplicated] = fallback[duplicated]
+    return edges
+
+
+def _subset_breakpoints(groups, values, subset, decile, method, ranking_method='dense'):
+    '''Breakpoints of every group computed on its `subset` rows only, NaN for groups without any.'''
+    edges = full((groups.max(initial=-1)+1, max(decile-1, 0)), nan)
+    sub_codes, sub_groups = factorize(groups[subset], sort=True)
+    if len(sub_groups):
+        edges[sub_groups] = _value_breakpoints(sub_codes, values[subset], decile, method, ranking_method)
+    return edges
+
+
+def _lookup_labels(periods, values, edges):
+    '''Assign portfolios from a (periods x breakpoints) table with one `searchsorted` over the
+    (period, breakpoint) keys. Rows of unknown periods (code -1) or of periods without breakpoints get 0.'''
+    n_periods, n_edges = edges.shape
+    missing = r_[isnan(edges).any(axis=1), True]
+    periods = where(periods < 0, n_periods, periods)
+    keys = _lexkeys(arange(n_periods).repeat(n_edges), where(missing[:-1, None], inf, edges).ravel())
+    crossed = searchsorted(keys, _lexkeys(periods, values), side='right') - n_edges*periods
+    return where(missing[periods], 0, crossed + 1)
+
+
+def _shift_by_period(entities, times, values, lag, fill=0):
+    '''Shift values `lag` periods forward within each entity, `fill` where the entity has no row `lag`
+    periods before. Periods are the distinct times of the panel, so a gap in an entity's history is not
+    skipped over.'''
+    entities = factorize(entities)[0]
+    times, uniques = factorize(times, sort=True)
+    # keys of one entity are at least lag apart from those of the next, so key - lag stays in its entity
+    key = entities*(len(uniques) + lag) + times
+    order = argsort(key, kind='stable')
+    sorted_key = key[order]
+    src = searchsorted(sorted_key, key - lag).clip(max=len(key) - 1)
+    found = (sorted_key[src] == key - lag) & (entities >= 0) & (times >= lag)
+    return where(found, values[order[src]], fill).astype(values.dtype)
+
+
+def _factorize_periods(times):
+    '''factorize(times, sort=True), without hashing if the times are sorted already, as in a panel
+    grouped by date.'''
+    if times.dtype.kind in 'Mmiuf' and (times[1:] >= times[:-1]).all():
+        new = r_[True, times[1:] != times[:-1]][:len(times)]
+        return new.cumsum() - 1, times[new]
+    return factorize(times, sort=True)
+
+
+def _subset_mask(panel_data, breakpoint_filter):
+    if isinstance(breakpoint_filter, str):
+        breakpoint_filter = panel_data.eval(breakpoint_filter)
+    return asarray(breakpoint_filter, dtype=bool)
+
+
+def univariate_sorting(panel_data: DataFrame, sort_on: str, decile: int = 10, port_label: str = 'port', time_label: str = 'jdate', entity_label: str = 'permno', method: str = 'ranking', ranking_method='dense', breakpoint_filter=None, breakpoints: DataFrame = None, return_breakpoints: bool = False, return_series: bool = False, lag: int = 0) -> DataFrame or Series:
     '''This function performs univariate sorting on panel data based on a specified variable and method.
 
     Parameters
@@ -62,41 +338,150 @@ def univariate_sorting(panel_data: DataFrame, sort_on: str, decile: int = 10, po
     following values: 'smart', 'qcut', 'ranking', or 'value'.
     ranking_method, optional
         The ranking_method parameter specifies the method used for assigning ranks to the data. It can take
-    values such as 'dense', 'min', 'max', 'average', 'first', 'random', etc. depending on the method
-    used for ranking.
+    values such as 'dense', 'min', 'max', 'average' or 'first', as in pandas' rank.
+    breakpoint_filter : str or array-like of bool, optional
+        A query string (e.g. "exchcd == 1" for NYSE breakpoints) or a boolean mask aligned with panel_data
+    that selects the observations on which breakpoints are computed. Portfolios are then assigned to all
+    observations with these breakpoints.
+    breakpoints : DataFrame, optional
+        A breakpoint table returned by a previous call (with the same decile) to assign portfolios with,
+    instead of computing breakpoints. Periods missing from the table get no portfolio.
+    return_breakpoints : bool, optional
+        If True, also return the breakpoint table. Default is False. With ranking_method='first', tied
+    values may be split between portfolios, which the table cannot express, so breakpoint_filter and
+    breakpoints do not support it.
+    return_series : bool, optional
+        If True, return only the portfolio numbers as a Series aligned with the index of panel_data, in a
+    nullable int8 (int16 for more than 127 portfolios) dtype, instead of merging them onto panel_data.
+    Default is False.
+    lag : int, optional
+        Shift portfolio numbers forward by `lag` periods (the distinct values of time_label) within each
+    entity, so that portfolios formed at t are held at t+lag and can be passed to `cal_portfolio_returns`
+    as they are. Rows of an entity without an observation `lag` periods before get no portfolio.
+    Default is 0.
 
     Returns
     -------
-        a DataFrame.
+        a DataFrame (a Series if return_series is True), or a tuple of it and the breakpoint table if
+    return_breakpoints is True.
+    The breakpoint table has one row per period and decile-1 columns; a value falls into portfolio k+1 if
+    it is >= breakpoint k and < breakpoint k+1.
 
     '''
 
-    _d = panel_data[[entity_label, time_label, sort_on]].copy().dropna()
-    if method == 'qcut':
-        _d.loc[:, port_label] = _d.groupby(time_label)[sort_on].transform(
-            lambda x: qcut(x, q=decile, labels=range(1, 1+decile))
-        )
-        _d.loc[:, port_label] = _d.loc[:, port_label].astype(int)
-    elif method == 'ranking':
-        _d.loc[:, port_label] = _d.groupby(time_label)[sort_on].transform(
-            lambda x: _periodic_sorting(
-                x, decile, ranking=True, ranking_method=ranking_method)
-        )
-    elif method == 'value':
-        _d.loc[:, port_label] = _d.groupby(time_label)[sort_on].transform(
-            lambda x: _periodic_sorting(
-                x, decile, ranking=False, ranking_method=ranking_method)
-        )
-    elif method == 'smart':
-        _d.loc[:, port_label] = _d.groupby(time_label)[sort_on].transform(
-            lambda x: _smart_periodic_sorting(x, decile)
-        )
+    values = panel_data[sort_on].to_numpy(dtype=float)
+    notna = ~isnan(values) & panel_data[entity_label].notna().to_numpy() & panel_data[time_label].notna().to_numpy()
+    values = values[notna]
+    times = panel_data[time_label].to_numpy()[notna]
+    if breakpoint_filter is None and breakpoints is None:
+        periods, uniques = _factorize_periods(times)
+        labels = _sort_labels(periods, values, decile, method, ranking_method)
+        if return_breakpoints:
+            # reported only: labels come from the sort itself, which 'first' ranks need as ties in one
+            # period can fall on both sides of a breakpoint
+            breakpoints = DataFrame(
+                _value_breakpoints(periods, values, decile, method, ranking_method),
+                index=Index(uniques, name=time_label), columns=range(1, decile))
     else:
-        raise InputError(
-            "The arg of method should be 'smart', 'qcut', 'ranking' or 'value', \
-                see documentation for details."
-        )
-    _d = _d[[entity_label, time_label, port_label]]
+        _check_value_cutoffs(method, ranking_method)
+        if breakpoints is None:
+            periods, uniques = _factorize_periods(times)
+            subset = _subset_mask(panel_data, breakpoint_filter)[notna]
+            breakpoints = DataFrame(
+                _subset_breakpoints(periods, values, subset, decile, method, ranking_method),
+                index=Index(uniques, name=time_label), columns=range(1, decile))
+        else:
+            periods = breakpoints.index.get_indexer(times)
+        labels = _lookup_labels(periods, values, breakpoints.to_numpy(dtype=float))
+    ports = zeros(len(panel_data), dtype=int8 if decile <= 127 else int16)
+    ports[notna] = labels
+    if lag:
+        ports = _shift_by_period(panel_data[entity_label], panel_data[time_label], ports, lag)
+    if return_series:
+        panel_data = Series(IntegerArray(ports, ports == 0), index=panel_data.index, name=port_label)
+    else:
+        # labels are in the row order of panel_data, so they are assigned in place of a merge on
+        # (entity, time); the result keeps the fresh range index and the dtype a left merge gives
+        panel_data = panel_data.reset_index(drop=True)
+        panel_data[port_label] = ports if (ports > 0).all() else where(ports > 0, ports, nan)
+    if return_breakpoints:
+        return panel_data, breakpoints
+    return panel_data
+
+
+def multivariate_sorting(panel_data: DataFrame, sort_on: list, decile: int or list = 5, port_label: str = 'port', time_label: str = 'jdate', entity_label: str = 'permno', method: str or list = 'ranking', ranking_method='dense', dependent: bool = False, breakpoint_filter=None) -> DataFrame:
+    '''This function performs independent or dependent (conditional) double/triple sorting on panel data.
+
+    Parameters
+    ----------
+    panel_data : DataFrame
+        a pandas DataFrame containing panel data with columns for entity identifier, time identifier, and
+    the variables to be sorted on
+    sort_on : list
+        The 2 or 3 variables/column names on which the sorting needs to be performed. In dependent sorts,
+    each variable is sorted within the portfolios of the variables before it.
+    decile : int or list, optional
+        The number of groups for every variable, or a list with one number per variable.
+    port_label : str, optional
+        The label for the column that will contain the combined portfolio code. Portfolio numbers of every
+    variable are kept in columns named f'{port_label}_{variable}'.
+    time_label : str, optional
+        The label for the time variable in the panel data.
+    entity_label : str, optional
+        The label for the entity identifier column in the panel data.
+    method : str or list, optional
+        The sorting method, 'smart', 'qcut', 'ranking', or 'value', or a list with one method per variable.
+    ranking_method, optional
+        The method used for assigning ranks to the data, as in `univariate_sorting`.
+    dependent : bool, optional
+        If True, sort each variable conditionally within the portfolios formed on the previous variables.
+    Otherwise, sort all variables independently. Default is False.
+    breakpoint_filter : str or array-like of bool, optional
+        A query string (e.g. "exchcd == 1") or a boolean mask aligned with panel_data that selects the
+    observations on which breakpoints are computed, as in `univariate_sorting`.
+
+    Returns
+    -------
+        a DataFrame. The combined code runs from 1 to the product of the deciles, in the order of
+    `sort_on`, e.g. with 5x5 portfolios, code 7 is portfolio 2 on the first and 2 on the second variable.
+
+    '''
+    if not 2 <= len(sort_on) <= 3:
+        raise InputError("The arg of sort_on should list 2 or 3 variables.")
+    deciles = decile if isinstance(decile, list) else [decile]*len(sort_on)
+    methods = method if isinstance(method, list) else [method]*len(sort_on)
+    if not len(deciles) == len(methods) == len(sort_on):
+        raise InputError("The args of decile and method should have one value per variable in sort_on.")
+
+    _d = panel_data[[entity_label, time_label] + sort_on]
+    notna = _d.notna().all(axis=1).to_numpy()
+    _d = _d[notna]
+    if breakpoint_filter is not None:
+        subset = _subset_mask(panel_data, breakpoint_filter)[notna]
+    periods = _factorize_periods(_d[time_label].to_numpy())[0]
+    groups = periods
+    code = zeros(len(_d), dtype=int)
+    valid = ones(len(_d), dtype=bool)
+    n_ports = 1
+    port_labels = []
+    for var, _decile, _method in zip(sort_on, deciles, methods):
+        values = _d[var].to_numpy(dtype=float)
+        if breakpoint_filter is None:
+            labels = _sort_labels(groups, values, _decile, _method, ranking_method)
+        else:
+            _check_value_cutoffs(_method, ranking_method)
+            labels = _lookup_labels(
+                groups, values, _subset_breakpoints(groups, values, subset, _decile, _method, ranking_method))
+        code = code*_decile + labels - 1
+        valid &= labels > 0
+        n_ports *= _decile
+        if dependent:
+            groups = factorize(periods*(n_ports+1) + where(valid, code, -1) + 1)[0]
+        _d.loc[:, f'{port_label}_{var}'] = labels
+        port_labels.append(f'{port_label}_{var}')
+    _d.loc[:, port_label] = code + 1
+    # groups without any breakpoint observation cannot be sorted
+    _d = _d[[entity_label, time_label, port_label] + port_labels][valid]
     panel_data = panel_data.merge(
         _d, on=[entity_label, time_label], how='left')
     return panel_data
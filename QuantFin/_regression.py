@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 
-from numpy import nan
+from numpy import arange, asarray, concatenate, cumsum, einsum, eye, isnan, nan, sqrt, unique, where, zeros
+from numpy.linalg import inv, matrix_rank, qr, solve
+from scipy.stats import norm, t as student_t
 import statsmodels.api as sm
-from pandas import concat, DataFrame
+from pandas import concat, DataFrame, MultiIndex, Series
+from QuantFin.HandleError import InputError
 
 class OLS:
     """
@@ -20,6 +23,197 @@ class OLS:
     def r2(self):
         return self.mod.rsquared_adj
 
+
+class BatchOLS:
+    """
+    OLS of every column of `ys` on the same regressors `x`, giving the same
+    estimates as fitting statsmodels' OLS column by column. The design matrix
+    is factored once for each pattern of missing values in `ys` (usually
+    just one) and all columns sharing it are solved together.
+
+    cov_type can be 'nonrobust', 'HC0'-'HC3' or 'HAC' (Bartlett kernel with
+    cov_kwds={'maxlags': L}, optionally 'use_correction'), as in
+    statsmodels. P-values use the t distribution for 'nonrobust' and the
+    normal distribution otherwise, unless use_t is given.
+    """
+
+    def __init__(self, ys, x, constant=True, cov_type='nonrobust', cov_kwds=None, use_t=None):
+        ys = ys.to_frame() if isinstance(ys, Series) else ys
+        x = self._design(x, len(ys), constant)
+        if use_t is None:
+            use_t = cov_type == 'nonrobust'
+        cov_kwds = cov_kwds or {}
+        y, xv = ys.to_numpy(dtype=float), x.to_numpy(dtype=float)
+        missing = isnan(y) | isnan(xv).any(axis=1)[:, None]
+        patterns, group = unique(missing.T, axis=0, return_inverse=True)
+        self.params = DataFrame(nan, index=x.columns, columns=ys.columns)
+        self.bse = self.params.copy()
+        self.df_resid = Series(nan, index=ys.columns)
+        for i, pattern in enumerate(patterns):
+            cols = arange(y.shape[1])[group.ravel() == i]
+            params, bse, df_resid = self._fit(
+                xv[~pattern], y[~pattern][:, cols], cov_type, cov_kwds)
+            self.params.iloc[:, cols] = params
+            self.bse.iloc[:, cols] = bse
+            self.df_resid.iloc[cols] = df_resid
+        self.tvalues = self.params / self.bse
+        if use_t:
+            self.pvalues = 2*DataFrame(
+                student_t.sf(abs(self.tvalues), self.df_resid), index=x.columns, columns=ys.columns)
+        else:
+            self.pvalues = 2*DataFrame(norm.sf(abs(self.tvalues)), index=x.columns, columns=ys.columns)
+
+    @staticmethod
+    def _design(x, nobs, constant):
+        if isinstance(x, Series):
+            x = x.to_frame()
+        elif not isinstance(x, DataFrame):
+            x = asarray(x, dtype=float).reshape(nobs, -1)
+            is_const = (x == x[0]).all(axis=0) & (x[0] != 0)
+            x = DataFrame(x, columns=['const' if c else f'x{i+1}' for i, c in enumerate(is_const)])
+        if constant and not ((x == x.iloc[0]).all() & (x.iloc[0] != 0)).any():
+            x = x.copy()
+            x.insert(0, 'const', 1.0)
+        return x
+
+    @staticmethod
+    def _fit(x, y, cov_type, cov_kwds):
+        nobs, k = x.shape
+        q, r = qr(x)
+        params = solve(r, q.T @ y)
+        resid = y - x @ params
+        xtx_inv = inv(r) @ inv(r).T
+        if cov_type == 'nonrobust':
+            sigma2 = (resid**2).sum(axis=0) / (nobs - k)
+            return params, sqrt(xtx_inv.diagonal()[:, None] * sigma2[None, :]), nobs - k
+        # every coefficient's sandwich variance is that of sum_t e_t * z_t, with z = x (X'X)^-1
+        z = x @ xtx_inv
+        if cov_type in ['HC0', 'HC1', 'HC2', 'HC3']:
+            e2 = resid**2
+            if cov_type in ['HC2', 'HC3']:
+                leverage = (z * x).sum(axis=1)[:, None]
+                e2 = e2 / (1 - leverage)**(1 if cov_type == 'HC2' else 2)
+            var = z.T**2 @ e2
+            if cov_type == 'HC1':
+                var = var * nobs / (nobs - k)
+        elif cov_type == 'HAC':
+            if cov_kwds.get('kernel', 'bartlett') != 'bartlett':
+                raise InputError("Only the Bartlett kernel is supported for HAC standard errors.")
+            maxlags = cov_kwds['maxlags']
+            h = z[:, :, None] * resid[:, None, :]
+            var = (h**2).sum(axis=0)
+            for lag in range(1, maxlags+1):
+                var += 2 * (1 - lag/(maxlags+1)) * (h[lag:] * h[:-lag]).sum(axis=0)
+            if cov_kwds.get('use_correction', False):
+                var = var * nobs / (nobs - k)
+        else:
+            raise InputError(
+                "The arg of cov_type should be 'nonrobust', 'HC0', 'HC1', 'HC2', 'HC3' or 'HAC'."
+            )
+        return params, sqrt(var), nobs - k
+
+    def stats(self, param):
+        return DataFrame([self.params.loc[param], self.tvalues.loc[param], self.pvalues.loc[param]],
+                         index=range(3))
+
+class RollingOLS:
+    """
+    Rolling (or expanding, with window=None) OLS of every column of `ys` on
+    the same regressors `x`, with nonrobust t-values. The estimates of a
+    window equal statsmodels' OLS on the window's non-missing rows.
+
+    X'X, X'y and y'y are kept as running sums, so that every window is the
+    difference of two of them instead of a refit from scratch. The sums are
+    restarted for every block of `window` rows and run over that block and
+    the one before it, so no difference spans more than 2*window rows. With
+    a constant in `x`, the other regressors and `ys` are also centered on
+    their means over those rows and the intercept is mapped back, so that
+    trending or far-from-zero data keep the precision of a direct fit. All
+    windows and columns are then solved as one stacked system. Columns
+    sharing a pattern of missing values share X'X.
+
+    window counts rows; a window is estimated when it has at least
+    min_periods (default window, or k+1 for expanding windows) non-missing
+    rows and X'X has full rank. params and tvalues are DataFrames indexed
+    like `ys`, with (column of ys, regressor) columns.
+    """
+
+    def __init__(self, ys, x, window=60, min_periods=None, constant=True):
+        ys = ys.to_frame() if isinstance(ys, Series) else ys
+        x = BatchOLS._design(x, len(ys), constant)
+        y, xv = ys.to_numpy(dtype=float), x.to_numpy(dtype=float)
+        nobs, k = xv.shape
+        if min_periods is None:
+            min_periods = window if window else k + 1
+        min_periods = max(min_periods, k + 1)
+        is_const = ((x == x.iloc[0]).all() & (x.iloc[0] != 0)).to_numpy()
+        const = int(is_const.argmax()) if is_const.any() else None
+        missing = isnan(y) | isnan(xv).any(axis=1)[:, None]
+        patterns, group = unique(missing.T, axis=0, return_inverse=True)
+        params, bse = zeros((nobs, y.shape[1], k)), zeros((nobs, y.shape[1], k))
+        for i, pattern in enumerate(patterns):
+            cols = arange(y.shape[1])[group.ravel() == i]
+            params[:, cols], bse[:, cols] = self._fit(
+                where(pattern[:, None], 0, xv), where(pattern[:, None], 0, y[:, cols]), ~pattern,
+                window, min_periods, const)
+        columns = MultiIndex.from_product([ys.columns, x.columns])
+        self.params = DataFrame(params.reshape(nobs, -1), index=ys.index, columns=columns)
+        self.bse = DataFrame(bse.reshape(nobs, -1), index=ys.index, columns=columns)
+        self.tvalues = self.params / self.bse
+
+    @staticmethod
+    def _segments(nobs, window):
+        # rows of every segment (nobs for rows out of range), and the segment and the bounds within
+        # it of every window: windows ending in block j use the rows of blocks j-1 and j
+        if not window:
+            return arange(nobs)[None, :], zeros(nobs, dtype=int), arange(nobs) + 1, zeros(nobs, dtype=int)
+        block = arange(nobs) // window
+        rows = arange(block.max(initial=0)+1)[:, None]*window + arange(-window, window)[None, :]
+        end = arange(nobs) - (block - 1)*window + 1
+        return where((rows < 0) | (rows >= nobs), nobs, rows), block, end, end - window
+
+    @classmethod
+    def _fit(cls, x, y, valid, window, min_periods, const):
+        nobs, k = x.shape
+        rows, block, end, start = cls._segments(nobs, window)
+        scale = x[valid, const][0] if const is not None and valid.any() else 1.
+        x = concatenate([x, zeros((1, k))])[rows]
+        y = concatenate([y, zeros((1, y.shape[1]))])[rows]
+        valid = concatenate([valid, [False]])[rows]
+        shift_x, shift_y = zeros((len(rows), k)), zeros((len(rows), y.shape[2]))
+        if const is not None:
+            count = valid.sum(axis=1).clip(1)[:, None]
+            shift_x, shift_y = x.sum(axis=1) / count, y.sum(axis=1) / count
+            shift_x[:, const] = 0
+            x = where(valid[:, :, None], x - shift_x[:, None, :], 0)
+            y = where(valid[:, :, None], y - shift_y[:, None, :], 0)
+
+        def window_sums(a):
+            total = concatenate([zeros((len(a), 1) + a.shape[2:]), cumsum(a, axis=1)], axis=1)
+            return total[block, end] - total[block, start]
+
+        n = window_sums(valid.astype(float))
+        xx = window_sums(einsum('sti,stj->stij', x, x))
+        xy = window_sums(einsum('sti,stp->stip', x, y))
+        yy = window_sums(y**2)
+        ok = n >= min_periods
+        ok[ok] = matrix_rank(xx[ok]) == k
+        xx[~ok] = eye(k)
+        params = solve(xx, xy)
+        ssr = yy - (params * xy).sum(axis=1)
+        xtx_inv = inv(xx)
+        if const is not None:
+            # y - shift_y = (a*scale - shift_y + b'shift_x) + b'(x - shift_x): only the intercept moves
+            shift_x, shift_y = shift_x[block], shift_y[block]
+            params[:, const] += (shift_y - einsum('ti,tip->tp', shift_x, params)) / scale
+            m = eye(k)[None].repeat(nobs, axis=0)
+            m[:, const] -= shift_x / scale
+            xtx_inv = einsum('tij,tjl,tml->tim', m, xtx_inv, m)
+        sigma2 = ssr / (n - k).clip(1)[:, None]
+        bse = sqrt(xtx_inv.diagonal(axis1=1, axis2=2)[:, :, None] * sigma2[:, None, :].clip(0))
+        params[~ok], bse[~ok] = nan, nan
+        return params.transpose(0, 2, 1), bse.transpose(0, 2, 1)
+
 def add_(x):
     if x != '':
         return f"({x})"
@@ -1,6 +1,69 @@
 # -*- coding: utf-8 -*-
-from numpy import nan, log, exp
-from pandas import DataFrame
+from concurrent.futures import ProcessPoolExecutor
+from numpy import (abs as npabs, arange, argsort, broadcast_to, column_stack, concatenate, cumsum, empty, empty_like,
+                   errstate, exp, eye, flatnonzero, full, inf, isnan, ix_, log, minimum, nan, packbits, pi,
+                   put_along_axis, ones, searchsorted, sqrt, take_along_axis, tile, where, zeros)
+from pandas import DataFrame, Index, Series, concat
+from scipy.signal import lfilter
+
+from QuantFin.HandleError import InputError
+
+def _trailing_sum(a, window):
+    # sums over the trailing window rows, as the difference of two running sums
+    total = cumsum(a, axis=0)
+    total[window:] -= total[:-window]
+    return total
+
+def _window_compound(ret, window):
+    '''Compounded returns over the trailing window rows of a 2-D array of returns.
+
+    Gross returns are compounded as a sum of log magnitudes, with the number of -100% returns and of
+    negative gross returns in the window counted separately, so that a window containing a -100% return
+    is exactly -100% and no division is ever needed. Missing returns count as 0; windows without any
+    return, and the first window-1 rows, are NaN.
+    '''
+    gross = 1 + ret
+    valid = ~isnan(gross)
+    wiped, neg = gross == 0, gross < 0
+    gross[~valid | wiped] = 1
+    prod = exp(_trailing_sum(log(abs(gross)), window))
+    if neg.any():
+        prod[_trailing_sum(neg.astype(float), window) % 2 > .5] *= -1
+    if wiped.any():
+        prod[_trailing_sum(wiped.astype(float), window) > .5] = 0
+    if not valid.all():
+        prod[_trailing_sum(valid.astype(float), window) < .5] = nan
+    prod[:window-1] = nan
+    return prod - 1
+
+class GeometricReturn:
+    '''Geometric returns over a rolling window that can be extended with new periods.
+
+    It keeps the returns of the last window-1 periods, so that `update` with new periods only compounds
+    the new rows instead of recomputing the history. Columns not seen before start without history.
+    
+    Parameters
+    ----------
+    window : int
+        The number of periods to use in the calculation of the geometric return.
+    decimals, optional
+        The number of decimal places to round the output to.
+    '''
+    def __init__(self, window: int, decimals: int = 4):
+        self.window = window
+        self.decimals = decimals
+        self._tail = None
+
+    def update(self, ret: DataFrame) -> DataFrame:
+        '''Geometric returns of the windows ending in the new periods of `ret`.'''
+        data = ret
+        if self._tail is not None:
+            columns = self._tail.columns.union(ret.columns, sort=False)
+            data = concat([self._tail.reindex(columns=columns), ret.reindex(columns=columns)])
+        _df = _window_compound(data.to_numpy(dtype=float), self.window)[len(data)-len(ret):]
+        _df = DataFrame(_df, index=ret.index, columns=data.columns)
+        self._tail = data.iloc[max(len(data)-self.window+1, 0):]
+        return _df.round(self.decimals)
 
 def geometric_ret(ret: DataFrame, window: int, decimals=4):
     '''This function calculates the geometric return of a DataFrame over a specified window.
@@ -18,23 +81,13 @@ def geometric_ret(ret: DataFrame, window: int, decimals=4):
     -------
         The function `geometric_ret` returns a DataFrame that contains the geometric returns calculated
     from the input DataFrame `ret` using a rolling window of size `window`. The calculated returns are
-    rounded to `decimals` decimal places and any zero values are replaced with NaN.
+    rounded to `decimals` decimal places. Missing returns count as 0 within a window; the first window-1
+    rows and windows without any return are NaN. Use `GeometricReturn` to append new periods later.
     
     '''
-    ret = ret + 1
-    _df = ret.copy()
-    _df.iloc[:window-1, :] = nan
-    prod = ret.iloc[:window, :].product()
-    _df.iloc[window-1, :] = prod
-    for i in range(window, len(_df)):
-        prod = prod / ret.iloc[i-window, :].fillna(1) * ret.iloc[i, :].fillna(1)
-        _df.iloc[i, :] = prod
-    _df = _df - 1
-    _df = _df.round(decimals)
-    _df = _df.replace(0, nan)
-    return _df
-
-def winsorize(data: DataFrame, var: str, interval: str, by: list = None, new_label: str = None, cutoff: bool = False):
+    return GeometricReturn(window, decimals).update(ret)
+
+def winsorize(data: DataFrame, var, interval: str, by: list = None, new_label=None, cutoff: bool = False):
     '''The function `winsorize` takes a DataFrame, a variable name, an interval, optional grouping
     variables, and optional parameters to winsorize the variable values within the specified interval.
     
@@ -44,10 +97,10 @@ def winsorize(data: DataFrame, var: str, interval: str, by: list = None, new_lab
         The `data` parameter is expected to be a DataFrame containing the dataset on which you want to
     perform winsorization. It should include the variable specified in the `var` parameter that you want
     to winsorize.
-    var : str
+    var : str or list
         The `var` parameter in the `winsorize` function refers to the column name in the DataFrame `data`
-    that you want to winsorize. It is the variable for which you want to apply the winsorization
-    procedure.
+    that you want to winsorize, or a list of column names to winsorize together. The bounds of all of
+    them are computed in one grouped pass.
     interval : str
         The `interval` parameter in the `winsorize` function specifies the range of percentiles to be used
     for winsorization. It is a string that represents the lower and upper bounds of the interval. For
@@ -56,10 +109,10 @@ def winsorize(data: DataFrame, var: str, interval: str, by: list = None, new_lab
         The `by` parameter in the `winsorize` function is used to specify a list of columns to group the
     data by before applying the winsorization process. This parameter allows you to perform
     winsorization within groups defined by the columns specified in the `by` list. If you do
-    new_label : str
+    new_label : str or list
         The `new_label` parameter in the `winsorize` function is used to specify a new label for the
-    winsorized variable in the output DataFrame. If provided, the winsorized variable will be renamed
-    with the value of `new_label`. If not provided, the winsorized variable
+    winsorized variable in the output DataFrame, or a list of labels, one for each variable in `var`. If
+    not provided, the winsorized variables keep their names.
     cutoff : bool, optional
         The `cutoff` parameter in the `winsorize` function determines whether the values outside the
     specified interval should be replaced with NaN (missing values) or clipped to the nearest value
@@ -68,7 +121,8 @@ def winsorize(data: DataFrame, var: str, interval: str, by: list = None, new_lab
     Returns
     -------
         The function `winsorize` returns a pandas Series containing the winsorized values of the specified
-    variable in the input DataFrame. If a new_label is provided, the Series is renamed accordingly
+    variable in the input DataFrame, or a DataFrame with a column for each variable if `var` is a list.
+    Either shares the index of `data`. If a new_label is provided, the output is renamed accordingly
     before being returned.
     
     '''
@@ -82,33 +136,297 @@ def winsorize(data: DataFrame, var: str, interval: str, by: list = None, new_lab
     if not (0<=d<=1 and 0<=u<=1):
         print("Percentiles should be between 0 and 1")
     
+    variables = [var] if isinstance(var, str) else list(var)
+    values = data[variables].to_numpy(dtype=float, copy=True)
     if by:
-        df = data.loc[:, by+[var]].set_index(by).copy()
-        df.loc[:, 'u'] = df.groupby(by)[var].quantile(u)
-        df.loc[:, 'd'] = df.groupby(by)[var].quantile(d)
+        grouped = data.groupby(by)
+        bounds = grouped[variables].quantile([d, u]).to_numpy(dtype=float).reshape(grouped.ngroups, 2, -1)
+        # rows of groups with a missing key get missing bounds and stay as they are
+        bounds = concatenate([bounds, full((1,) + bounds.shape[1:], nan)])
+        codes = grouped.ngroup().fillna(grouped.ngroups).to_numpy(dtype=int)
+        lower, upper = bounds[codes, 0], bounds[codes, 1]
     else:
-        df = data.loc[:, [var]].copy()
-        df.loc[:, 'u'] = df.loc[:, var].quantile(u)
-        df.loc[:, 'd'] = df.loc[:, var].quantile(d)
-    
+        bounds = data[variables].quantile([d, u]).to_numpy(dtype=float)
+        lower, upper = bounds[0], bounds[1]
+    lower = broadcast_to(lower, values.shape)
+    upper = broadcast_to(upper, values.shape)
+
     if cutoff:
-        if '(' == dc:
-            df.loc[df[var]<df['d'], var] = nan
-        if ')' == uc:
-            df.loc[df[var]>df['u'], var] = nan
-        if '[' == dc:
-            df.loc[df[var]<=df['d'], var] = nan
-        if ']' == uc:
-            df.loc[df[var]>=df['u'], var] = nan
+        below = values < lower if '(' == dc else values <= lower
+        above = values > upper if ')' == uc else values >= upper
+        values[below | above] = nan
     else:
-        df.loc[df[var]<df['d'], var] = df.loc[df[var]<df['d'], 'd']
-        df.loc[df[var]>df['u'], var] = df.loc[df[var]>df['u'], 'u']
-            
-    df.index = data.index
-    df = df[var]
-    if new_label:
-        df = df.rename(new_label)
-    return df
+        below, above = values < lower, values > upper
+        values[below] = lower[below]
+        values[above] = upper[above]
+
+    if isinstance(var, str):
+        return Series(values[:, 0], index=data.index, name=new_label if new_label else var, copy=False)
+    if isinstance(new_label, str):
+        new_label = [new_label]
+    return DataFrame(values, index=data.index, columns=new_label if new_label else variables, copy=False)
+
+def _ewma_filter(x2, lambda_, burnin, count, total, state):
+    '''RiskMetrics variances of every row of squared returns x2, given every column's number of earlier
+    returns (count), their sum during the burn-in (total) and the variance after them (state).
+
+    Columns are grouped by their pattern of missing values (and how much burn-in they still need), and
+    every group is run through one linear filter along the rows. A missing return leaves the variance
+    unchanged. Returns the variances and the updated count, total and state.
+    '''
+    n_rows, n_cols = x2.shape
+    valid = ~isnan(x2)
+    m = valid.sum(axis=0)
+    need = minimum((burnin - count).clip(0), m + 1)
+    sigma2 = full((n_rows, n_cols), nan)
+    total, state = total.copy(), state.copy()
+    groups = {}
+    for j, pattern in enumerate(packbits(valid, axis=0).T):
+        groups.setdefault((pattern.tobytes(), need[j]), []).append(j)
+    for (_, n_need), cols in groups.items():
+        rows = flatnonzero(valid[:, cols[0]])
+        v = x2[ix_(rows, cols)]
+        if n_need > len(rows):
+            total[cols] += v.sum(axis=0)
+            continue
+        s0 = (total[cols] + v[:n_need].sum(axis=0)) / burnin if n_need > 0 else state[cols]
+        # u[k]: the variance after the (n_need + k)-th return of the chunk
+        u = empty((len(rows) - n_need + 1, len(cols)))
+        u[0] = s0
+        u[1:] = lfilter([1 - lambda_], [1, -lambda_], v[n_need:], axis=0, zi=lambda_*s0[None, :])[0]
+        state[cols] = u[-1]
+        k = searchsorted(rows, arange(n_rows)) - n_need
+        sigma2[ix_(flatnonzero(k >= 0), cols)] = u[k[k >= 0]]
+    return sigma2, count + m, total, state
+
+class EWMAVariance:
+    '''RiskMetrics (EWMA) variances of many assets that can be extended with new returns.
+
+    The variance of a date is lambda_ times the variance of the previous date plus (1 - lambda_) times
+    the squared return of the previous date; a missing return leaves it unchanged. Every asset is
+    seeded with the mean squared return of its first `burnin` returns. The state of every asset is
+    carried between calls of `update`, so daily runs only filter the new returns.
+    
+    Parameters
+    ----------
+    burnin : int
+        The number of returns of an asset used to seed its variance.
+    lambda_ : float
+        The decay factor. Default is 0.94.
+    '''
+    def __init__(self, burnin: int, lambda_: float = 0.94):
+        self.burnin = burnin
+        self.lambda_ = lambda_
+        self._count = Series(dtype=int)
+        self._total = Series(dtype=float)
+        self._state = Series(dtype=float)
+
+    @property
+    def forecast(self) -> Series:
+        '''The variance of the next date after the returns seen so far.'''
+        return self._state.copy()
+
+    def update(self, new_returns: DataFrame) -> DataFrame:
+        '''Variances of the dates of `new_returns`, each using only the returns before it.'''
+        columns = self._state.index.union(new_returns.columns, sort=False)
+        count = self._count.reindex(columns, fill_value=0).to_numpy()
+        total = self._total.reindex(columns, fill_value=0.).to_numpy()
+        state = self._state.reindex(columns).to_numpy(dtype=float)
+        x2 = new_returns.reindex(columns=columns).to_numpy(dtype=float)**2
+        sigma2, count, total, state = _ewma_filter(x2, self.lambda_, self.burnin, count, total, state)
+        self._count = Series(count, index=columns)
+        self._total = Series(total, index=columns)
+        self._state = Series(state, index=columns)
+        return DataFrame(sigma2, index=new_returns.index, columns=columns)
+
+_GARCH_PARAMS = ['mu', 'omega', 'alpha', 'gamma', 'beta']
+_MAX_PERSISTENCE = 0.9999
+
+def _garch_params(z, sd, mean):
+    '''GARCH parameters of the unconstrained z (assets x 5). omega is positive, alpha, gamma and beta are
+    non-negative and the persistence alpha + gamma/2 + beta stays below one.'''
+    mu = z[:, 0] * sd if mean else zeros(len(sd))
+    omega = exp(z[:, 1]) * sd**2
+    persistence = _MAX_PERSISTENCE / (1 + exp(-z[:, 2]))
+    w = exp(column_stack([z[:, 3], z[:, 4], zeros(len(sd))]))
+    w = w / w.sum(axis=1, keepdims=True)
+    return mu, omega, persistence*w[:, 0], 2*persistence*w[:, 1], persistence*w[:, 2]
+
+def _garch_z(params, sd):
+    '''The inverse of _garch_params.'''
+    mu, omega, alpha, gamma, beta = (params[:, i] for i in range(5))
+    persistence = (alpha + gamma/2 + beta).clip(1e-6, _MAX_PERSISTENCE*(1-1e-6))
+    w = column_stack([alpha, gamma/2, beta]).clip(1e-8) / persistence[:, None]
+    return column_stack([mu/sd, log(omega/sd**2), log(persistence/(_MAX_PERSISTENCE-persistence)),
+                         log(w[:, 0]/w[:, 2]), log(w[:, 1]/w[:, 2])])
+
+def _garch_nll(z, r, mask, n, sd, mean):
+    '''Average Gaussian negative log-likelihood (without constants) and conditional variances of every
+    column of r, evaluating the variance recursion for all columns at once. Rows outside mask do not
+    count. The recursion starts from the mean squared residual.'''
+    mu, omega, alpha, gamma, beta = _garch_params(z, sd, mean)
+    e = where(mask, r - mu, 0)
+    e2 = e**2
+    shock = omega + (alpha + gamma*(e < 0)) * e2
+    s2 = empty_like(e2)
+    s2[0] = e2.sum(axis=0) / n
+    for t in range(1, len(s2)):
+        s2[t] = shock[t-1] + beta*s2[t-1]
+    return 0.5*where(mask, log(s2) + e2/s2, 0).sum(axis=0) / n, s2
+
+def _garch_fit_chunk(r, mask, z, gjr, mean, maxiter, gtol=1e-5):
+    '''Fit GARCH to every column of r (valid rows first, as marked by mask) from the starting values z.
+
+    Every column runs its own BFGS, but all of them step in lockstep: gradients come from finite-difference
+    moves of one parameter in all columns at once, evaluated in one recursion over stacked copies of the
+    data, and backtracking line searches only re-evaluate the columns whose step was rejected. Columns
+    drop out as they converge.
+    '''
+    n = mask.sum(axis=0)
+    mean_r = where(mask, r, 0).sum(axis=0) / n
+    sd = sqrt(where(mask, (r - mean_r)**2, 0).sum(axis=0) / n)
+    active = [i for i in range(5) if (i != 0 or mean) and (i != 4 or gjr)]
+    if not gjr:
+        z[:, 4] = -inf
+    k, h = len(active), 1e-7
+
+    def f(x, cols):
+        zz = z[cols].copy()
+        zz[:, active] = x
+        return _garch_nll(zz, r[:, cols], mask[:, cols], n[cols], sd[cols], mean)[0]
+
+    def fg(x, cols):
+        m = len(cols)
+        zz = tile(z[cols], (k+1, 1))
+        zz[:, active] = tile(x, (k+1, 1))
+        for j, a in enumerate(active):
+            zz[(j+1)*m:(j+2)*m, a] += h
+        nll = _garch_nll(zz, tile(r[:, cols], k+1), tile(mask[:, cols], k+1), tile(n[cols], k+1),
+                         tile(sd[cols], k+1), mean)[0].reshape(k+1, m)
+        return nll[0], ((nll[1:] - nll[0]) / h).T
+
+    with errstate(over='ignore', invalid='ignore', divide='ignore'):
+        x = z[:, active].copy()
+        cols = arange(r.shape[1])
+        fx, g = fg(x, cols)
+        hess = tile(eye(k), (len(cols), 1, 1))
+        todo = arange(len(cols))
+        for it in range(maxiter):
+            todo = todo[npabs(g[todo]).max(axis=1) > gtol]
+            if not len(todo):
+                break
+            d = -(hess[todo] @ g[todo][:, :, None])[:, :, 0]
+            slope = (d * g[todo]).sum(axis=1)
+            reset = ~(slope < 0)
+            d[reset], slope[reset] = -g[todo][reset], -(g[todo][reset]**2).sum(axis=1)
+            hess[todo[reset]] = eye(k)
+            step = ones(len(todo))
+            f_new = f(x[todo] + d, todo)
+            for _ in range(40):
+                bad = ~(f_new <= fx[todo] + 1e-4*step*slope)
+                if not bad.any():
+                    break
+                step[bad] /= 2
+                f_new[bad] = f(x[todo[bad]] + step[bad, None]*d[bad], todo[bad])
+            moved = ~bad
+            todo = todo[moved]
+            s_ = step[moved, None]*d[moved]
+            x_new = x[todo] + s_
+            fx_new, g_new = fg(x_new, todo)
+            y_ = g_new - g[todo]
+            sy = (s_ * y_).sum(axis=1)
+            if it == 0:
+                hess[todo] *= (sy / (y_ * y_).sum(axis=1)).clip(1e-4, 1e4)[:, None, None]
+            upd = sy > 1e-12
+            rho = 1 / sy[upd, None, None]
+            v = eye(k) - rho * s_[upd][:, :, None] * y_[upd][:, None, :]
+            hess[todo[upd]] = v @ hess[todo[upd]] @ v.transpose(0, 2, 1) + rho * s_[upd][:, :, None] * s_[upd][:, None, :]
+            x[todo], fx[todo], g[todo] = x_new, fx_new, g_new
+    z[:, active] = x
+    nll, s2 = _garch_nll(z, r, mask, n, sd, mean)
+    params = column_stack(_garch_params(z, sd, mean))
+    loglik = -n*(nll + 0.5*log(2*pi))
+    return params, loglik, s2
+
+class GARCH:
+    '''GARCH(1,1), or GJR-GARCH(1,1) with gjr=True, of many assets estimated together.
+
+    r_t = mu + e_t and sigma2_t = omega + (alpha + gamma*1[e_{t-1} < 0])*e_{t-1}^2 + beta*sigma2_{t-1},
+    estimated by Gaussian quasi maximum likelihood on every asset's non-missing returns. Assets are
+    fitted in chunks of `chunk_size`; the variance recursion of a chunk runs for all its assets at
+    once, and with n_jobs > 1 chunks are fitted in a process pool. Estimates are kept in `params` and
+    later fits start from them, so refitting on an extended sample converges in a few iterations.
+    
+    Parameters
+    ----------
+    gjr : bool, optional
+        Include the asymmetric term gamma. Default is False.
+    mean : bool, optional
+        Estimate the constant mean mu; otherwise mu is 0. Default is True.
+    min_obs : int, optional
+        Assets with fewer returns are not fitted. Default is 100.
+    chunk_size : int, optional
+        The number of assets optimized together. Default is 256.
+    maxiter : int, optional
+        The maximum number of BFGS iterations per asset. Default is 500.
+    '''
+    def __init__(self, gjr: bool = False, mean: bool = True, min_obs: int = 100, chunk_size: int = 256, maxiter: int = 500):
+        self.gjr = gjr
+        self.mean = mean
+        self.min_obs = min_obs
+        self.chunk_size = chunk_size
+        self.maxiter = maxiter
+        self.params = DataFrame(columns=_GARCH_PARAMS + ['loglik', 'nobs'], dtype=float)
+
+    def _start(self, assets, sd):
+        gamma = 0.04 if self.gjr else 0.
+        alpha = 0.03 if self.gjr else 0.05
+        params = tile([0., 0., alpha, gamma, 0.9], (len(assets), 1))
+        params[:, 1] = 0.05*sd**2
+        known = self.params.index.intersection(assets)
+        if len(known):
+            loc = Index(assets).get_indexer(known)
+            params[loc] = self.params.loc[known, _GARCH_PARAMS].to_numpy(dtype=float)
+        return _garch_z(params, sd)
+
+    def fit(self, returns: DataFrame, n_jobs: int = 1) -> DataFrame:
+        '''Fit every asset (column) of `returns` and return their conditional variances, NaN on missing
+        returns and for assets with fewer than min_obs returns. The estimates are stored in `params`.'''
+        r = returns.to_numpy(dtype=float)
+        valid = ~isnan(r)
+        n = valid.sum(axis=0)
+        fitted = flatnonzero(n >= self.min_obs)
+        sigma2 = full(r.shape, nan)
+        if not len(fitted):
+            return DataFrame(sigma2, index=returns.index, columns=returns.columns)
+        # move every asset's returns to the top rows, keeping their order
+        order = argsort(~valid[:, fitted], axis=0, kind='stable')[:n[fitted].max()]
+        padded = take_along_axis(r[:, fitted], order, axis=0)
+        mask = arange(len(padded))[:, None] < n[fitted]
+        padded = where(mask, padded, 0)
+        sd = padded.std(axis=0, where=mask)
+        z = self._start(returns.columns[fitted], sd)
+
+        chunks = [slice(i, i + self.chunk_size) for i in range(0, len(fitted), self.chunk_size)]
+        jobs = [(padded[:, c], mask[:, c], z[c], self.gjr, self.mean, self.maxiter) for c in chunks]
+        if n_jobs > 1:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                results = list(executor.map(_garch_fit_chunk, *zip(*jobs)))
+        else:
+            results = [_garch_fit_chunk(*job) for job in jobs]
+        params = concatenate([res[0] for res in results])
+        loglik = concatenate([res[1] for res in results])
+        s2 = concatenate([res[2] for res in results], axis=1)
+
+        # order holds rows of r, so the scatter back needs all of them even if no asset has a full history
+        out = full((len(r), len(fitted)), nan)
+        put_along_axis(out, order, where(mask, s2, nan), axis=0)
+        sigma2[:, fitted] = out
+        sigma2[~valid] = nan
+        estimates = DataFrame(params, index=returns.columns[fitted], columns=_GARCH_PARAMS)
+        estimates['loglik'], estimates['nobs'] = loglik, n[fitted]
+        self.params = concat([self.params.drop(estimates.index, errors='ignore'), estimates])
+        return DataFrame(sigma2, index=returns.index, columns=returns.columns)
 
 class Volatility:
     """
@@ -162,46 +480,144 @@ class Volatility:
         -------
             The function `vol_ewma` returns a DataFrame `sigma2_samp` containing the exponentially weighted
         moving average (EWMA) of squared returns calculated using the input DataFrame `ret`, a specified
-        burn-in period `burnin`, and a decay parameter `lambda_`.
+        burn-in period `burnin`, and a decay parameter `lambda_`. The variance of a date only uses returns
+        before it; it is seeded with the mean squared return of an asset's first `burnin` returns and
+        NaN until then. Use `EWMAVariance` to extend it with new returns later.
         
         '''
-        data2 = data**2
-        data2_burn = data2[:burnin]
-        data2_samp = data2[burnin:]
-        time_line = list(data2_samp.index)
-        sigma2_samp = data2_burn.var().rename(time_line[0]).to_frame().T
-        for i,t in enumerate(time_line[1:]):
-            t_1 = time_line[i-1]
-            sigma2 = (1 - lambda_)*data2_samp.loc[t_1, :] + lambda_*sigma2_samp.loc[t_1, :]
-            sigma2_samp.loc[t, :] = sigma2
-        return sigma2_samp
-    
-    def vol_garch(self):
+        return EWMAVariance(burnin, lambda_).update(data).iloc[burnin:]
+
+    def vol_garch(self, data: DataFrame, gjr: bool = False, n_jobs: int = 1, **args) -> DataFrame:
+        '''The function estimates GARCH(1,1) (or GJR-GARCH(1,1)) conditional variances of every asset.
+        
+        Parameters
+        ----------
+        data : DataFrame
+            The returns data, one column per asset.
+        gjr : bool, optional
+            Estimate GJR-GARCH(1,1) with an asymmetric term for negative shocks.
+        n_jobs : int, optional
+            The number of processes fitting chunks of assets. Default is 1.
+        args
+            Other arguments of `GARCH`, e.g., mean, min_obs and chunk_size.
         
-        pass
+        Returns
+        -------
+            A DataFrame of conditional variances with the shape of `data`. The estimates are kept on this
+        Volatility (`garch_params`), and later calls with the same model start from them.
+        
+        '''
+        if not hasattr(self, '_garch'):
+            self._garch = {}
+        key = (gjr,) + tuple(sorted(args.items()))
+        if key not in self._garch:
+            self._garch[key] = GARCH(gjr=gjr, **args)
+        model = self._garch[key]
+        sigma2 = model.fit(data, n_jobs=n_jobs)
+        self.garch_params = model.params
+        return sigma2
+
+def _prefix_sum(a):
+    '''Prefix sums of a 1-D array with a leading 0, so that a[lo:hi].sum() == out[hi] - out[lo].'''
+    out = empty(len(a) + 1)
+    out[0] = 0
+    cumsum(a, out=out[1:])
+    return out
+
+def _log_prefix_sums(ret):
+    '''Prefix sums of the log gross returns of a 1-D array, with -100%, negative and missing returns
+    counted separately as in `_window_compound`, for compounding any [lo, hi) slice with `_compound`.'''
+    gross = 1 + ret
+    valid = ~isnan(gross)
+    wiped, neg = gross == 0, gross < 0
+    gross[~valid | wiped] = 1
+    sums = {'log': _prefix_sum(log(npabs(gross))), 'valid': _prefix_sum(valid)}
+    if neg.any():
+        sums['neg'] = _prefix_sum(neg)
+    if wiped.any():
+        sums['wiped'] = _prefix_sum(wiped)
+    return sums
+
+def _compound(sums, lo, hi):
+    '''Compounded returns over the slices [lo, hi) of the returns behind `_log_prefix_sums`; NaN for
+    slices without any return.'''
+    prod = exp(sums['log'][hi] - sums['log'][lo])
+    if 'neg' in sums:
+        prod[(sums['neg'][hi] - sums['neg'][lo]) % 2 > .5] *= -1
+    if 'wiped' in sums:
+        prod[sums['wiped'][hi] - sums['wiped'][lo] > .5] = 0
+    prod[sums['valid'][hi] - sums['valid'][lo] < .5] = nan
+    return prod - 1
 
 class CumulativeReturn:
-    """
-    developing... ... 
-    """
-    def _geometric(self, data: DataFrame, pre: int, post: int) -> DataFrame:
-        data = data.fillna(0) + 1
-        window = abs(post - pre) + 1
-        for i in range(1, window):
-            _cr = _cr * data.shift(i)
-        _cr = _cr.shift(-post)
-        _cr = _cr - 1
-        _cr = _cr.replace(0, nan)
-        return _cr
-
-    def _logsum(self, data: DataFrame, pre: int, post: int) -> DataFrame:
-        data = data.fillna(0) + 1
-        window = abs(post - pre) + 1
-        _cr = log(data)
-        _cr = _cr.rolling(window=window, min_periods=window).sum()
-        _cr = (exp(_cr)-1).shift(-post)
-        _cr = _cr.replace(0, nan)
-        _cr = _cr.stack().rename(f'CR[{pre},{post}]').to_frame()
-        _cr[abs(_cr[f'CR[{pre},{post}]']) < 0.0000001] = nan
-        _cr = _cr.loc[:, f'CR_{pre}_{post}'].unstack()
-        return _cr
\ No newline at end of file
+    '''Cumulative returns of every entity over windows of trading days around each date.
+
+    The log gross returns of each entity are prefix-summed once, so the return over a window [pre, post]
+    around a row is the difference of two lookups into the prefix sums, and all windows come from the
+    same pass over the panel. As in `geometric_ret`, -100% and negative gross returns are counted
+    separately and missing returns count as 0. Windows running past an entity's first or last date, and
+    windows without any return, are NaN.
+
+    Parameters
+    ----------
+    windows : list
+        Windows as (pre, post) pairs of trading days relative to each date, both ends included, e.g.,
+        [(-1, 1), (0, 5), (-12, -2)].
+    '''
+    def __init__(self, windows: list):
+        self.windows = [(int(pre), int(post)) for pre, post in windows]
+        for pre, post in self.windows:
+            if pre > post:
+                raise InputError(f'The window [{pre},{post}] ends before it starts.')
+
+    def fit(self, data_set: DataFrame, entity: str, date: str, on: str, benchmark: str = None) -> DataFrame:
+        '''The function compounds the returns of every entity over every window.
+
+        Parameters
+        ----------
+        data_set : DataFrame
+            A panel data dataframe in long format with columns of entity, date and return.
+        entity : str
+            Name of entity. e.g. 'permno' in CRSP dataset.
+        date : str
+            Name of date. e.g. 'date' in CRSP dataset.
+        on : str
+            Name of return. e.g. 'ret' in CRSP dataset.
+        benchmark : str, optional
+            Name of a benchmark return, e.g., the market return on each date. If given, the compounded
+        benchmark return over the same window is subtracted, i.e., buy-and-hold abnormal returns.
+
+        Returns
+        -------
+            A DataFrame with the index of `data_set`, holding entity, date and a column CR[pre,post] for
+        every window.
+
+        '''
+        keys = data_set[[entity, date]].reset_index(drop=True)
+        order = keys.sort_values([entity, date], kind='stable').index.to_numpy()
+        ids = keys[entity].to_numpy()[order]
+        n = len(order)
+        first = concatenate([[True], ids[1:] != ids[:-1]])[:n]
+        starts = flatnonzero(first)
+        group = cumsum(first) - 1
+        lower = starts[group]
+        upper = concatenate([starts[1:], [n]])[group]
+        pos = arange(n)
+        sums = _log_prefix_sums(data_set[on].to_numpy(dtype=float)[order])
+        if benchmark is not None:
+            bench = _log_prefix_sums(data_set[benchmark].to_numpy(dtype=float)[order])
+
+        df = keys.copy()
+        for pre, post in self.windows:
+            lo, hi = pos + pre, pos + post + 1
+            inside = (lo >= lower) & (hi <= upper)
+            lo, hi = lo.clip(0, n), hi.clip(0, n)
+            cr = _compound(sums, lo, hi)
+            if benchmark is not None:
+                cr -= _compound(bench, lo, hi)
+            cr[~inside] = nan
+            out = empty(n)
+            out[order] = cr
+            df[f'CR[{pre},{post}]'] = out
+        df.index = data_set.index
+        return df
@@ -27,7 +27,7 @@ setup(
     url="https://github.com/yuz0101/QuantFin",
     download_url='https://github.com/yuz0101/QuantFin/archive/refs/tags/0.0.10',
     keywords=['ACADEMIC', 'EMPIRICAL', 'FIANCE', 'RESEARCH', 'QUANT', 'PORTFOLIO'],
-    install_requires=["numpy", "pandas", "linearmodels", "statsmodels", "requests"],
+    install_requires=["numpy", "pandas", "linearmodels>=7.0,<8", "statsmodels", "scipy", "requests"],
     
     classifiers=[
         "Intended Audience :: Developers",
@@ -0,0 +1,69 @@
+import pytest
+from numpy.random import default_rng
+from pandas import DataFrame, date_range, qcut
+
+from QuantFin import univariate_sorting
+from QuantFin.HandleError import InputError
+
+
+def _panel_with_ties():
+    rng = default_rng(0)
+    dates = date_range('2000-01-31', periods=10, freq='ME')
+    return DataFrame({
+        'permno': list(range(300))*len(dates),
+        'date': dates.repeat(300),
+        'size': rng.integers(0, 20, 300*len(dates)).astype(float),
+        'nyse': rng.random(300*len(dates)) < 0.4,
+    })
+
+
+@pytest.mark.parametrize('ranking_method', ['first', 'dense', 'min', 'max', 'average'])
+def test_return_breakpoints_keeps_labels(ranking_method):
+    df = _panel_with_ties()
+    kwargs = dict(sort_on='size', decile=10, time_label='date', entity_label='permno',
+                  method='ranking', ranking_method=ranking_method)
+    ports = univariate_sorting(df, **kwargs)
+    ports_bp, table = univariate_sorting(df, return_breakpoints=True, **kwargs)
+    assert ports['port'].equals(ports_bp['port'])
+    assert table.shape == (10, 9)
+
+
+def test_first_ranking_rejects_breakpoint_table():
+    df = _panel_with_ties()
+    kwargs = dict(sort_on='size', decile=10, time_label='date', entity_label='permno',
+                  method='ranking', ranking_method='first')
+    with pytest.raises(InputError):
+        univariate_sorting(df, breakpoint_filter='nyse', **kwargs)
+    table = univariate_sorting(df, return_breakpoints=True, **kwargs)[1]
+    with pytest.raises(InputError):
+        univariate_sorting(df, breakpoints=table, **kwargs)
+
+
+@pytest.mark.parametrize('layout', ['grouped', 'shuffled', 'uneven'])
+def test_qcut_matches_pandas(layout):
+    df = _panel_with_ties()
+    df['size'] += default_rng(1).random(len(df))
+    if layout == 'shuffled':
+        df = df.sample(frac=1, random_state=0)
+    elif layout == 'uneven':
+        # one period much larger than the others, too uneven for the padded layout
+        df = df[(df['date'] == df['date'].iloc[0]) | (df['permno'] < 30)]
+    ports = univariate_sorting(df, 'size', 10, time_label='date', entity_label='permno', method='qcut',
+                               return_series=True)
+    expected = df.groupby('date')['size'].transform(lambda x: qcut(x, 10, labels=False) + 1)
+    assert (ports == expected).all()
+
+
+def test_lag_skips_no_periods():
+    dates = date_range('2000-01-31', periods=4, freq='ME')
+    df = DataFrame({
+        'permno': [1]*4 + [2]*3,
+        'date': dates.append(dates.delete(1)),
+        'size': [1., 2., 3., 4., 10., 30., 40.],
+    })
+    kwargs = dict(sort_on='size', decile=2, time_label='date', entity_label='permno', method='smart',
+                  return_series=True)
+    p = univariate_sorting(df, **kwargs).tolist()
+    # entity 2 has no row in February, so its March row has nothing to hold with lag=1
+    assert univariate_sorting(df, lag=1, **kwargs).fillna(0).tolist() == [0, p[0], p[1], p[2], 0, 0, p[5]]
+    assert univariate_sorting(df, lag=2, **kwargs).fillna(0).tolist() == [0, 0, p[0], p[1], 0, p[4], 0]
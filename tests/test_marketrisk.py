@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+from numpy.random import SeedSequence, default_rng
+from pandas import DataFrame, Series
+
+from QuantFin.HandleError import InputError
+from QuantFin.MarketRisk import HistoricalES, HistoricalVaR, MonteCarloVaR
+from QuantFin.tool import EWMAVariance
+
+
+def _pnl(T=300, C=4):
+    rng = default_rng(0)
+    x = DataFrame(rng.standard_t(4, size=(T, C))*0.01)
+    x.iloc[100:120, 1] = np.nan
+    x.iloc[::17, 2] = np.nan
+    x[3] = x[3].round(3)  # ties
+    return x
+
+
+def _tail(values, alpha):
+    # VaR and ES as positive losses of the k = ceil(n*(1-alpha)) smallest
+    k = int(np.ceil(len(values)*(1 - alpha) - 1e-9))
+    s = np.sort(values)
+    return -s[k-1], -s[:k].mean()
+
+
+def _brute(x, alpha, window, min_periods, tail=_tail):
+    var, es = np.full(x.shape, np.nan), np.full(x.shape, np.nan)
+    for t in range(len(x)):
+        for c in range(x.shape[1]):
+            lo = max(0, t - window + 1)
+            if x.iloc[lo:t+1, c].notna().sum() >= min_periods:
+                var[t, c], es[t, c] = tail(x, t, c, lo)
+    return var, es
+
+
+@pytest.mark.parametrize('alpha, window, min_periods', [(.99, 250, None), (.95, 100, 50), (.975, 60, 30)])
+def test_historical_var_es_match_sorted_windows(alpha, window, min_periods):
+    x = _pnl()
+    var, es = HistoricalVaR().pnl(x, alpha, window, min_periods)
+    expected = _brute(x, alpha, window, min_periods or window,
+                      lambda x, t, c, lo: _tail(x.iloc[lo:t+1, c].dropna().to_numpy(), alpha))
+    np.testing.assert_allclose(var, expected[0], rtol=1e-12)
+    np.testing.assert_allclose(es, expected[1], rtol=1e-12)
+    for got, same in zip(HistoricalES().pnl(x, alpha, window, min_periods), (var, es)):
+        np.testing.assert_array_equal(got, same)
+
+
+def test_age_weighted_var_es():
+    x, alpha, lambda_ = _pnl(), .95, .98
+
+    def tail(x, t, c, lo):
+        r = x.iloc[lo:t+1, c].to_numpy()
+        w = lambda_**np.arange(t - lo, -1, -1.)
+        w, r = w[~np.isnan(r)], r[~np.isnan(r)]
+        order = np.argsort(r, kind='stable')
+        r, w = r[order], w[order]/w.sum()
+        i = np.searchsorted(np.cumsum(w), 1 - alpha - 1e-12)
+        before = w[:i].sum()
+        return -r[i], -((r[:i]*w[:i]).sum() + (1 - alpha - before)*r[i])/(1 - alpha)
+
+    var, es = HistoricalVaR().age_weighted(x, alpha, 100, lambda_, min_periods=50)
+    expected = _brute(x, alpha, 100, 50, tail)
+    np.testing.assert_allclose(var, expected[0], rtol=1e-10)
+    np.testing.assert_allclose(es, expected[1], rtol=1e-10)
+
+
+def test_volatility_weighted_var_es():
+    x, alpha = _pnl(), .99
+    sigma2 = EWMAVariance(20, .94).update(x).to_numpy()
+    latest = np.where(x.isna(), sigma2, .94*sigma2 + .06*x.to_numpy()**2)
+    z = x/np.sqrt(sigma2)
+
+    def tail(x, t, c, lo):
+        return tuple(np.sqrt(latest[t, c])*np.array(_tail(z.iloc[lo:t+1, c].dropna().to_numpy(), alpha)))
+
+    var, es = HistoricalVaR().volatility_weighted(x, alpha, 100, min_periods=60)
+    expected = _brute(z, alpha, 100, 60, tail)
+    np.testing.assert_allclose(var, expected[0], rtol=1e-10)
+    np.testing.assert_allclose(es, expected[1], rtol=1e-10)
+
+
+@pytest.mark.parametrize('alpha, window', [(1.5, 10), (.99, 0)])
+def test_historical_var_arguments(alpha, window):
+    with pytest.raises(InputError):
+        HistoricalVaR().pnl(_pnl(), alpha, window)
+
+
+COV = DataFrame([[.04, .01, 0], [.01, .09, .02], [0, .02, .01]], index=list('abc'), columns=list('abc'))
+BOOKS = DataFrame([[1, 2, 0], [0, -1, 3]], index=['b1', 'b2'], columns=list('abc'))
+
+
+def test_monte_carlo_streams_are_reproducible():
+    mc = MonteCarloVaR(COV, df=5)
+    kwargs = dict(alpha=[.99, .95], n_sims=50000, chunk_size=7000, seed=1)
+    var, es = mc.monte_carlo(BOOKS, **kwargs)
+    for again in (mc.monte_carlo(BOOKS, **kwargs), mc.monte_carlo(BOOKS, n_jobs=3, **kwargs)):
+        np.testing.assert_array_equal(again[0], var)
+        np.testing.assert_array_equal(again[1], es)
+    assert not mc.monte_carlo(BOOKS, **dict(kwargs, seed=2))[0].equals(var)
+    assert var.index.tolist() == [.99, .95] and var.columns.tolist() == ['b1', 'b2']
+
+
+def test_monte_carlo_tail_is_exact():
+    # the merged chunk tails give the VaR and ES of all scenarios of the same streams
+    mc = MonteCarloVaR(COV, mean=Series([.01, 0, -.01], index=list('abc')), df=6)
+    var, es = mc.monte_carlo(BOOKS.iloc[0], alpha=.99, n_sims=25000, chunk_size=4000, seed=7)
+    pnl = []
+    for n, child in zip([4000]*6 + [1000], SeedSequence(7).spawn(7)):
+        rng = default_rng(child)
+        ret = rng.standard_normal((n, 3)) @ mc.factor.T
+        ret *= np.sqrt(4/rng.chisquare(6, n))[:, None]
+        pnl.append((ret + mc.mean) @ BOOKS.iloc[0].to_numpy(dtype=float))
+    expected = _tail(np.concatenate(pnl), .99)
+    np.testing.assert_allclose([var['b1'], es['b1']], expected, rtol=1e-12)
+
+
+def test_monte_carlo_normal_quantiles():
+    var, es = MonteCarloVaR(COV).monte_carlo(Series([1, 2, 0], index=list('abc')), alpha=.95,
+                                             n_sims=400000, seed=3)
+    sd = np.sqrt(np.array([1, 2, 0]) @ COV.to_numpy() @ np.array([1, 2, 0]))
+    np.testing.assert_allclose(var.item(), sd*1.6448536, rtol=.01)
+    np.testing.assert_allclose(es.item(), sd*2.0627128, rtol=.01)
+
+
+def test_monte_carlo_semidefinite_factor():
+    v = np.array([[1., 2., 3.]])
+    cov = v.T @ v*.01
+    factor = MonteCarloVaR(cov).factor
+    np.testing.assert_allclose(factor @ factor.T, cov, atol=1e-14)
+    with pytest.raises(InputError):
+        MonteCarloVaR(cov, df=2)
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from linearmodels import PanelOLS
+from numpy.random import default_rng
+from pandas import DataFrame, date_range
+from pandas.testing import assert_frame_equal
+
+from QuantFin import multiregs
+from QuantFin.PanelRegs import _FormulaPlan, _panel_reg
+
+
+def _panel(n_entities=60, n_periods=24):
+    rng = default_rng(0)
+    df = DataFrame({
+        'permno': np.repeat(np.arange(n_entities), n_periods),
+        'date': np.tile(date_range('2000-01-31', periods=n_periods, freq='ME'), n_entities),
+        'x1': rng.normal(size=n_entities*n_periods),
+        'x2': rng.normal(size=n_entities*n_periods),
+    })
+    df['year'] = df['date'].dt.year
+    df['ind'] = (df['permno'] + df['date'].dt.month) % 7
+    df['y'] = 0.5*df['x1'] - 0.2*df['x2'] + df['permno'] % 5 + rng.normal(size=len(df))
+    df.loc[rng.random(len(df)) < 0.05, 'x2'] = np.nan
+    return df.set_index(['permno', 'date'], drop=False)
+
+
+@pytest.mark.parametrize('formula', [
+    'y ~ x1 + x2, fe(permno)',
+    'y ~ 1 + x1 + x2, fe(permno)',
+    'y ~ 1 + x1 + x2, fe(permno year), robust',
+    'y ~ 1 + x1 + x2, fe(permno ind), cluster(permno)',
+    'y ~ x1 + x2, fe(year), kernel(bartlett 3)',
+])
+def test_absorbed_fe_matches_panelols(formula):
+    data = _panel()
+    res = _panel_reg(formula, data.copy())
+    plan = _FormulaPlan(formula)
+    data['_cons'] = 1.
+    cov_config = {'clusters': data[plan.clusters]} if plan.clusters else {}
+    if plan.kernel:
+        cov_config.update(kernel=plan.kernel, bandwidth=plan.bandwidth)
+    ref = PanelOLS(data[plan.dep], data[plan.xvars], other_effects=data[plan.effects]).fit(
+        cov_type=plan.cov_type, debiased=True, auto_df=True, count_effects=True, **cov_config)
+    np.testing.assert_allclose(res.params, ref.params, rtol=1e-6)
+    np.testing.assert_allclose(res.std_errors, ref.std_errors, rtol=1e-6)
+    for stat in ['nobs', 'df_resid', 'rsquared', 'rsquared_within', 'rsquared_overall']:
+        np.testing.assert_allclose(getattr(res, stat), getattr(ref, stat), rtol=1e-6, atol=1e-10)
+
+
+@pytest.mark.parametrize('backend', ['thread', 'process'])
+def test_multiregs_pool_matches_serial(backend):
+    data = _panel()
+    formulas = {f'({i})': f'y ~ 1 + x1{" + x2" if i % 2 else ""}, fe(permno)' for i in range(6)}
+    serial = multiregs(formulas, data, 'permno', 'date')
+    pooled = multiregs(formulas, data, 'permno', 'date', n_jobs=2, backend=backend)
+    assert_frame_equal(pooled, serial)
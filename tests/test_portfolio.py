@@ -0,0 +1,36 @@
+import numpy as np
+from numpy.random import default_rng
+from pandas import DataFrame, date_range
+from pandas.testing import assert_frame_equal
+
+from QuantFin import Performance, cal_portfolio_returns
+from QuantFin._regression import RollingOLS
+
+
+def test_lagged_weights_skip_no_periods():
+    dates = date_range('2000-01-31', periods=3, freq='ME')
+    df = DataFrame({
+        'permno': [1, 1, 1, 2, 2, 3, 3, 3],
+        'date': dates.append(dates.delete(1)).append(dates),
+        'ret': [0.01, 0.02, 0.03, 0.10, 0.20, -0.01, -0.02, -0.03],
+        'me': [1., 2., 3., 100., 200., 5., 5., 5.],
+    })
+    rets = cal_portfolio_returns(df, 'ret', 'date', weight_on='me', schemes=['lvw'], entity_label='permno')
+    # entity 2 has no February row, so its large January cap does not weight its March return
+    expected = [np.nan, (1*0.02 + 5*-0.02)/6, (2*0.03 + 5*-0.03)/7]
+    np.testing.assert_allclose(rets['lvw'], expected)
+
+
+def test_rolling_after_summary_keeps_portfolios(monkeypatch):
+    rng = default_rng(0)
+    dates = date_range('2000-01-31', periods=48, freq='ME', name='date')
+    factors = DataFrame(rng.normal(size=(48, 3))/100, index=dates, columns=['Mkt-RF', 'SMB', 'HML'])
+    ports = DataFrame(rng.normal(size=(48, 2))/100, index=dates, columns=['P1', 'P2'])
+    monkeypatch.setattr(Performance, '_get_factor_data', lambda self, model: factors)
+    perf = Performance(ports, models=['FF3'])
+    perf.summary()
+    # summary() leaves the FF3 factors in df; only Mkt-RF is a CAPM factor, SMB and HML are no portfolios
+    rolling = perf.rolling(window=24, models=['CAPM'])
+    assert rolling.columns.get_level_values('Portfolio').unique().tolist() == ['P1', 'P2']
+    expected = RollingOLS(ports, factors[['Mkt-RF']], window=24).params
+    assert_frame_equal(rolling['CAPM']['coef'], expected, check_names=False)
@@ -0,0 +1,145 @@
+import numpy as np
+import pytest
+import statsmodels.api as sm
+from numpy.random import default_rng
+from pandas import DataFrame, bdate_range, concat, date_range
+from pandas.testing import assert_frame_equal
+from scipy.stats import skew
+
+from QuantFin.HandleError import InputError
+from QuantFin.Proxy import Illquidity, Lottery, Momentum, Turnover
+
+
+def _daily_panel():
+    rng = default_rng(0)
+    dates = bdate_range('2020-01-01', '2020-06-30')
+    n = len(dates)
+    return DataFrame({
+        'permno': [10001]*n + [10002]*n,
+        'date': dates.append(dates),
+        'ret': rng.normal(0, 0.02, 2*n),
+        'prc': rng.uniform(5, 50, 2*n),
+        'vol': rng.integers(1000, 100000, 2*n).astype(float),
+        'shrout': 5000.,
+    })
+
+
+@pytest.mark.parametrize('dates', [lambda d: d.dt.strftime('%Y%m%d').astype(int), lambda d: d.dt.strftime('%Y-%m-%d')],
+                         ids=['integer', 'iso'])
+def test_dates_from_csv(tmp_path, dates):
+    daily = _daily_panel()
+    f = tmp_path/'dsf.csv'
+    daily.assign(date=dates(daily['date'])).to_csv(f, index=False)
+    for proxy in (Illquidity(min_days=15), Turnover(min_days=15)):
+        expected = proxy.fit(daily, chunksize=50)
+        result = type(proxy)(min_days=15).fit(str(f), chunksize=50)
+        assert len(result) == 12
+        assert (result['jdate'].dt.year == 2020).all()
+        assert_frame_equal(result, expected)
+
+
+def _max_panel():
+    daily = _daily_panel()
+    third = daily[daily['permno'] == 10002].assign(permno=10003).iloc[40:]
+    daily = concat([daily, third], ignore_index=True)
+    # ties within a month are broken by date, as nlargest does, and missing returns are skipped
+    daily['ret'] = daily['ret'].round(2)
+    daily.loc[daily.index[::7], 'ret'] = np.nan
+    return daily
+
+
+def test_max_ret_matches_nlargest():
+    daily = _max_panel()
+    res = Lottery().max_ret(daily, 'permno', 'date', 'ret', 3)
+    for (permno, month), g in daily.dropna(subset=['ret']).groupby(['permno', daily['date'].dt.to_period('M')]):
+        row = res[(res['permno'] == permno) & (res['jdate'].dt.to_period('M') == month)]
+        assert len(row) == 1
+        top = g.nlargest(3, 'ret')
+        assert row[['max1_ret', 'max2_ret', 'max3_ret']].values.ravel().tolist() == top['ret'].tolist()
+        assert row[['max1_date', 'max2_date', 'max3_date']].values.ravel().tolist() == top['date'].tolist()
+    assert len(res) == daily.dropna(subset=['ret']).groupby(['permno', daily['date'].dt.to_period('M')]).ngroups
+
+
+def test_max_ret_chunks():
+    daily = _max_panel()
+    expected = Lottery().max_ret(daily, 'permno', 'date', 'ret', 2)
+    assert_frame_equal(Lottery().max_ret(daily, 'permno', 'date', 'ret', 2, chunk_size=1, n_jobs=2), expected)
+    shards = [g for _, g in daily.groupby('permno')]
+    assert_frame_equal(Lottery().max_ret(iter(shards), 'permno', 'date', 'ret', 2), expected)
+
+
+def _monthly_panel():
+    rng = default_rng(1)
+    dates = date_range('2010-01-31', periods=40, freq='ME')
+    df = DataFrame({'permno': np.repeat([1, 2, 3], 40), 'date': np.tile(dates, 3),
+                    'ret': rng.normal(0.01, 0.08, 120), 'dlret': np.nan})
+    df.loc[5, 'ret'] = np.nan
+    df.loc[79, 'dlret'] = -0.3
+    # entity 2 has no row in its 11th month, which must not be bridged over
+    return df.drop(index=50).sample(frac=1, random_state=0)
+
+
+def _window_returns(df, row, lo, hi):
+    # the returns of the entity of row in the months lo..hi before its own, by month rather than by row
+    ret = df['ret'].where(df['dlret'].isna(), (1 + df['ret'].fillna(0))*(1 + df['dlret']) - 1)
+    months = df['date'].dt.to_period('M')
+    own = (df['permno'] == df.loc[row, 'permno']) & (months <= months[row] - lo) & (months >= months[row] - hi)
+    return ret[own]
+
+
+def test_cross_sectional_mom_by_period():
+    df = _monthly_panel()
+    res = Momentum().cross_sectional_mom(df, 'permno', 'date', 'ret', windows=[(12, 1), (6, 0)],
+                                         min_periods=5, delist='dlret')
+    assert res[['permno', 'date']].equals(df.sort_values(['permno', 'date'], ignore_index=True)[['permno', 'date']])
+    for row, (permno, date) in df[['permno', 'date']].iterrows():
+        got = res[(res['permno'] == permno) & (res['date'] == date)]
+        for formation, skip in [(12, 1), (6, 0)]:
+            window = _window_returns(df, row, skip, formation-1)
+            expected = (1 + window.fillna(0)).prod() - 1 if window.notna().sum() >= 5 else np.nan
+            np.testing.assert_allclose(got[f'MOM[{formation},{skip}]'].item(), expected, rtol=1e-12)
+
+
+def test_time_series_mom_target_vol():
+    df = _monthly_panel()
+    res = Momentum().time_series_mom(df, 'permno', 'date', 'ret', formation=12, skip=0, target_vol=.4,
+                                     vol_window=24, delist='dlret', chunk_size=1, n_jobs=2)
+    for row, (permno, date) in df[['permno', 'date']].iterrows():
+        got = res[(res['permno'] == permno) & (res['date'] == date)]
+        past = _window_returns(df, row, 0, 11)
+        mom = (1 + past.fillna(0)).prod() - 1 if past.notna().sum() >= 12 else np.nan
+        recent = _window_returns(df, row, 0, 23).dropna()
+        vol = recent.std()*np.sqrt(12) if len(recent) >= 24 else np.nan
+        np.testing.assert_allclose(got['VOL'].item(), vol, rtol=1e-10)
+        np.testing.assert_allclose(got['TSMOM[12,0]'].item(), np.sign(mom)*.4/vol, rtol=1e-10)
+
+
+def test_momentum_window_order():
+    with pytest.raises(InputError):
+        Momentum().cross_sectional_mom(_monthly_panel(), 'permno', 'date', 'ret', windows=[(3, 3)])
+
+
+def test_ivol_iskew_match_monthly_ols():
+    daily = _daily_panel()
+    rng = default_rng(2)
+    dates = daily['date'].drop_duplicates()
+    factors = DataFrame(rng.normal(0, .01, size=(len(dates), 3)), index=dates.to_numpy(),
+                        columns=['Mkt-RF', 'SMB', 'HML'])
+    factors['RF'] = .0001
+    # days without factors are left out, which takes March of 10002 below min_obs
+    factors = factors.drop(index=dates.iloc[[3, 4]].to_numpy())
+    daily.loc[(daily['permno'] == 10002) & (daily['date'].dt.month == 3) & (daily['date'].dt.day > 9), 'ret'] = np.nan
+    lottery = Lottery()
+    ivol = lottery.ivol(daily, 'permno', 'date', 'ret', factors=factors, min_obs=10)
+    iskew = lottery.skewexp(daily, 'permno', 'date', 'ret', factors=factors, min_obs=10, chunk_size=1, n_jobs=2)
+    assert ivol[['permno', 'jdate', 'nobs']].equals(iskew[['permno', 'jdate', 'nobs']])
+    data = daily.dropna().merge(factors, left_on='date', right_index=True)
+    for i, ((permno, month), g) in enumerate(data.groupby(['permno', data['date'].dt.to_period('M')])):
+        assert (ivol.loc[i, 'permno'], ivol.loc[i, 'jdate'].to_period('M')) == (permno, month)
+        assert ivol.loc[i, 'nobs'] == len(g)
+        if len(g) < 10:
+            assert np.isnan(ivol.loc[i, 'IVOL']) and np.isnan(iskew.loc[i, 'ISKEW'])
+            continue
+        fit = sm.OLS(g['ret'] - g['RF'], sm.add_constant(g[['Mkt-RF', 'SMB', 'HML']])).fit()
+        np.testing.assert_allclose(ivol.loc[i, 'IVOL'], np.sqrt(fit.ssr/fit.df_resid), rtol=1e-8)
+        np.testing.assert_allclose(iskew.loc[i, 'ISKEW'], skew(fit.resid), rtol=1e-6)
@@ -0,0 +1,90 @@
+import os
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from zipfile import ZipFile
+
+import pytest
+from pandas.testing import assert_frame_equal
+
+from QuantFin import KenFrenchLib
+from QuantFin.ReqData import ZhiDaLib, _parse_french_csv
+
+CSV = '''This file was created using the 202401 CRSP database.
+
+,Mkt-RF,SMB,XYZ
+202301,1.00,-0.50,-99.99
+202302,2.00,0.25,-99.99
+
+  Annual Factors: January-December
+,Mkt-RF,SMB,XYZ
+2023,3.00,-0.25,-99.99
+'''
+
+
+def test_cache_keeps_all_missing_columns(tmp_path):
+    sections = _parse_french_csv(CSV.splitlines())
+    lib = KenFrenchLib(fpath=f'{tmp_path}/')
+    lib._write_cache('test', sections)
+    KenFrenchLib.clear_cache()
+    cached = lib._read_cache('test')
+    assert list(cached) == list(sections)
+    for key, data in sections.items():
+        assert data['XYZ'].isna().all()
+        assert_frame_equal(cached[key], data, check_freq=False)
+
+
+NAT = 'NAT\r\n\r\nChen, Da and Huang (2019)\r\n\r\nnotes\r\n\r\nmore notes\r\n\r\n' \
+      'DATE\t\tNAT\r\n20200131\t\t0.5\r\n20200228\t\t-0.25\r\n'
+
+
+@pytest.fixture
+def server(tmp_path):
+    """A local stand-in for the data libraries, serving the files of a directory and logging requests."""
+    root = tmp_path/'www'
+    root.mkdir()
+    requests = []
+
+    class Handler(SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            requests.append(self.path)
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), partial(Handler, directory=str(root)))
+    Thread(target=httpd.serve_forever, daemon=True).start()
+    yield root, f'http://127.0.0.1:{httpd.server_port}/', requests
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_ken_french_prefetch(tmp_path, server):
+    root, domain, requests = server
+    for name in ['F-F_Research_Data_Factors', 'F-F_Momentum_Factor']:
+        with ZipFile(root/f'{name}_CSV.zip', 'w') as z:
+            z.writestr(f'{name}.csv', CSV)
+    KenFrenchLib.clear_cache()
+    lib = KenFrenchLib(fpath=f'{tmp_path}/lib/', domain=domain)
+    assert lib.prefetch(['FF3', 'MOM', 'missing']) == ['F-F_Research_Data_Factors', 'F-F_Momentum_Factor']
+    assert sorted(os.listdir(tmp_path/'lib')) == ['F-F_Momentum_Factor_sections.parquet',
+                                                 'F-F_Research_Data_Factors_sections.parquet']
+    n_requests = len(requests)
+    KenFrenchLib.clear_cache()
+    factors = lib.get_factors('FF3', 'M')
+    assert len(requests) == n_requests
+    assert list(factors.columns) == ['Mkt-RF', 'SMB', 'XYZ']
+    assert factors['Mkt-RF'].tolist() == [0.01, 0.02]
+
+
+def test_zhi_da_prefetch(tmp_path, server):
+    root, domain, requests = server
+    (root/'nat.txt').write_bytes(NAT.encode())
+    (root/'fears.csv').write_text('date,FEARS\n01/02/2020,0.1\n')
+    lib = ZhiDaLib(fpath=f'{tmp_path}/lib/', domain=domain)
+    assert lib.prefetch(['nat.txt', 'fears.csv', 'missing.xlsx']) == ['nat.txt', 'fears.csv']
+    n_requests = len(requests)
+    nat = lib.get_nat_data()
+    fears = lib.get_fear_index(filename='fears.csv')
+    assert len(requests) == n_requests
+    assert nat['nat'].tolist() == [0.5, -0.25]
+    assert fears['FEARS'].tolist() == [0.1]
+    lib.get_nat_data(update=True)
+    assert len(requests) == n_requests + 1
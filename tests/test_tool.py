@@ -0,0 +1,204 @@
+import numpy as np
+import pytest
+from numpy.random import default_rng
+from pandas import DataFrame, date_range
+from scipy.optimize import minimize
+
+from QuantFin.HandleError import InputError
+from QuantFin.tool import (CumulativeReturn, EWMAVariance, GARCH, GeometricReturn, Volatility, _garch_nll, _garch_z, geometric_ret,
+                          winsorize)
+
+
+def _simulate_garch(T=1000, N=4, omega=1e-5, alpha=0.08, beta=0.9, seed=0):
+    rng = default_rng(seed)
+    r = np.empty((T, N))
+    s2 = np.full(N, omega/(1 - alpha - beta))
+    for t in range(T):
+        e = np.sqrt(s2)*rng.standard_normal(N)
+        r[t] = 0.0005 + e
+        s2 = omega + alpha*e**2 + beta*s2
+    return DataFrame(r)
+
+
+def test_garch_every_asset_with_gaps():
+    df = _simulate_garch(T=300, N=2)
+    df.iloc[-1, 0] = np.nan
+    df.iloc[0, 1] = np.nan
+    sigma2 = GARCH().fit(df)
+    assert sigma2.shape == df.shape
+    assert (sigma2.isna() == df.isna()).all().all()
+    for c in df:
+        alone = GARCH().fit(df[[c]].dropna())
+        np.testing.assert_allclose(sigma2[c].dropna(), alone[c], rtol=1e-6)
+
+
+def test_garch_reaches_the_optimum():
+    df = _simulate_garch(N=2)
+    model = GARCH()
+    model.fit(df)
+    params = model.params[['mu', 'omega', 'alpha', 'gamma', 'beta']]
+    for c in df:
+        x = df[[c]].to_numpy()
+        mask, n, sd = np.ones_like(x, dtype=bool), np.array([len(x)]), x.std(axis=0)
+
+        def nll(z):
+            return _garch_nll(np.r_[z, -np.inf][None, :], x, mask, n, sd, True)[0][0]
+
+        z = _garch_z(params.loc[[c]].to_numpy(), sd)[0, :4]
+        best = minimize(nll, z, method='Nelder-Mead', options={'xatol': 1e-8, 'fatol': 1e-12})
+        assert nll(z) <= best.fun + 1e-6
+
+
+def test_vol_garch_warm_start():
+    df = _simulate_garch()
+    vol = Volatility()
+    first = vol.vol_garch(df.iloc[:800]).copy()
+    params = vol.garch_params.copy()
+    model = vol._garch[(False,)]
+    np.testing.assert_allclose(model._start(df.columns, np.ones(len(df.columns))),
+                               _garch_z(params[['mu', 'omega', 'alpha', 'gamma', 'beta']].to_numpy(),
+                                        np.ones(len(df.columns))))
+    again = vol.vol_garch(df.iloc[:800])
+    assert len(vol._garch) == 1
+    np.testing.assert_allclose(again, first, rtol=1e-4)
+    vol.vol_garch(df)
+    assert (vol.garch_params['nobs'] == len(df)).all()
+    cold = GARCH()
+    cold.fit(df)
+    np.testing.assert_allclose(vol.garch_params['loglik'], cold.params['loglik'], rtol=1e-6)
+
+
+def test_garch_too_few_observations():
+    df = _simulate_garch(T=50, N=2)
+    assert GARCH(min_obs=100).fit(df).isna().all().all()
+
+
+def _returns(T=40, N=3, seed=0):
+    rng = default_rng(seed)
+    ret = DataFrame(rng.normal(0, .05, size=(T, N)), columns=list('abc')[:N])
+    ret.iloc[5, 0] = -1.      # wiped out
+    ret.iloc[12, 1] = -1.5    # negative gross return
+    ret.iloc[20, 2] = 0.      # a genuine 0%
+    ret.iloc[25:33, 2] = np.nan
+    return ret
+
+
+def _brute_geometric(ret, window):
+    out = np.full(ret.shape, np.nan)
+    for t in range(window-1, len(ret)):
+        w = ret.iloc[t-window+1:t+1]
+        out[t] = np.where(w.notna().any(), (1 + w.fillna(0)).prod() - 1, np.nan)
+    return out
+
+
+def test_geometric_ret_matches_window_products():
+    ret = _returns()
+    np.testing.assert_allclose(geometric_ret(ret, 4, decimals=12), _brute_geometric(ret, 4), atol=1e-12)
+
+
+def test_geometric_return_updates_match_one_pass():
+    ret = _returns()
+    engine = GeometricReturn(6, decimals=12)
+    parts = [engine.update(ret.iloc[:3]), engine.update(ret.iloc[3:17]), engine.update(ret.iloc[17:])]
+    np.testing.assert_array_equal(np.concatenate(parts), geometric_ret(ret, 6, decimals=12))
+
+
+def _brute_ewma(ret, burnin, lambda_):
+    out = np.full(ret.shape, np.nan)
+    for j in range(ret.shape[1]):
+        count, total, s2 = 0, 0., np.nan
+        for t, x in enumerate(ret.iloc[:, j]):
+            out[t, j] = s2
+            if np.isnan(x):
+                continue
+            count += 1
+            if count <= burnin:
+                total += x**2
+                s2 = total/burnin if count == burnin else np.nan
+            else:
+                s2 = lambda_*s2 + (1-lambda_)*x**2
+    return out
+
+
+def test_ewma_variance_matches_recursion():
+    ret = _returns(60)
+    ret.iloc[2:4, 0] = np.nan
+    np.testing.assert_allclose(EWMAVariance(10, .9).update(ret), _brute_ewma(ret, 10, .9), rtol=1e-12)
+    np.testing.assert_allclose(Volatility().vol_ewma(ret, 10, .9), _brute_ewma(ret, 10, .9)[10:], rtol=1e-12)
+
+
+def test_ewma_variance_chunked_updates():
+    ret = _returns(60)
+    ret.iloc[:30, 1] = np.nan
+    engine = EWMAVariance(10, .9)
+    # the first chunk ends within every burn-in, and column c only arrives with the second one
+    parts = [engine.update(ret.iloc[:6, :2]), engine.update(ret.iloc[6:35]), engine.update(ret.iloc[35:])]
+    chunked = np.concatenate([parts[0].reindex(columns=ret.columns)] + parts[1:])
+    np.testing.assert_allclose(chunked[:, :2], _brute_ewma(ret.iloc[:, :2], 10, .9), rtol=1e-12)
+    np.testing.assert_allclose(chunked[6:, 2], _brute_ewma(ret.iloc[6:, 2:], 10, .9)[:, 0], rtol=1e-12)
+    # the forecast is the variance of a next date without a return yet
+    ahead = _brute_ewma(ret.iloc[:, :2].reindex(range(61)), 10, .9)[-1]
+    np.testing.assert_allclose(engine.forecast[['a', 'b']], ahead, rtol=1e-12)
+
+
+def test_cumulative_return_matches_window_products():
+    rng = default_rng(0)
+    lengths = {1: 30, 2: 8, 3: 20}
+    panel = DataFrame({
+        'permno': np.repeat(list(lengths), list(lengths.values())),
+        'date': np.concatenate([date_range('2020-01-01', periods=n, freq='B') for n in lengths.values()]),
+    })
+    panel['ret'] = rng.normal(0, .03, len(panel))
+    panel['mkt'] = rng.normal(0, .01, len(panel))
+    panel.loc[[3, 4, 40], 'ret'] = [np.nan, -1., np.nan]
+    panel = panel.sample(frac=1, random_state=0).set_axis(range(100, 100+len(panel)))
+    windows = [(-1, 1), (0, 5), (-12, -2)]
+    res = CumulativeReturn(windows).fit(panel, 'permno', 'date', 'ret', benchmark='mkt')
+    assert res.index.equals(panel.index)
+    for _, g in panel.sort_values('date').groupby('permno'):
+        for i, row in enumerate(g.index):
+            for pre, post in windows:
+                w = g.iloc[i+pre:i+post+1] if 0 <= i+pre and i+post < len(g) else None
+                expected = np.nan if w is None or w['ret'].isna().all() else \
+                    (1 + w['ret'].fillna(0)).prod() - (1 + w['mkt']).prod()
+                np.testing.assert_allclose(res.loc[row, f'CR[{pre},{post}]'], expected, atol=1e-12)
+
+
+def test_cumulative_return_window_order():
+    with pytest.raises(InputError):
+        CumulativeReturn([(2, 1)])
+
+
+def _brute_winsorize(data, var, by, d, u, cutoff, dc, uc):
+    out = data[var].copy()
+    for _, g in data.groupby(by):
+        lo, hi = np.nanquantile(g[var], d), np.nanquantile(g[var], u)
+        if cutoff:
+            below = g[var] < lo if dc == '(' else g[var] <= lo
+            above = g[var] > hi if uc == ')' else g[var] >= hi
+            out[g.index[below | above]] = np.nan
+        else:
+            out[g.index] = g[var].clip(lo, hi)
+    return out
+
+
+@pytest.mark.parametrize('interval, cutoff', [('[.05, .95]', False), ('[.05, .95)', True), ('(.1, .8]', True)])
+def test_winsorize_variables_by_group(interval, cutoff):
+    rng = default_rng(0)
+    data = DataFrame({'year': rng.integers(2000, 2004, 300).astype(float),
+                      'x': rng.normal(size=300), 'y': rng.standard_t(2, 300)})
+    data.loc[[0, 7], 'x'] = np.nan
+    data.loc[[3], 'year'] = np.nan
+    d, u = (float(v) for v in interval[1:-1].split(','))
+    res = winsorize(data, ['x', 'y'], interval, by=['year'], new_label=['wx', 'wy'], cutoff=cutoff)
+    assert res.columns.tolist() == ['wx', 'wy'] and res.index.equals(data.index)
+    # a row without a group keeps its values
+    assert res.loc[3].tolist() == data.loc[3, ['x', 'y']].tolist()
+    for var, label in [('x', 'wx'), ('y', 'wy')]:
+        expected = _brute_winsorize(data, var, 'year', d, u, cutoff, interval[0], interval[-1])
+        np.testing.assert_allclose(res[label], expected)
+    single = winsorize(data, 'y', interval, by=['year'], cutoff=cutoff)
+    np.testing.assert_array_equal(single, res['wy'])
+    assert single.name == 'y'
+    ungrouped = _brute_winsorize(data.assign(all=0), 'x', 'all', d, u, cutoff, interval[0], interval[-1])
+    np.testing.assert_allclose(winsorize(data, 'x', interval, cutoff=cutoff), ungrouped)